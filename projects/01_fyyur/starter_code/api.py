@@ -0,0 +1,235 @@
+import json
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import Blueprint, Response, abort, jsonify, make_response, request, stream_with_context
+
+from cache import page_cache
+from counters import naive_local
+from models import Venue, Artist, SHOW_DURATION
+from queries import (
+    iter_venue_directory, venue_details, artist_details, past_shows_page,
+    iter_artists, iter_shows, artists_page, shows_page, browse, available_slots
+)
+from writebehind import write_behind
+from lookups import artist_names, venue_names
+
+#----------------------------------------------------------------------------#
+# JSON API.
+#
+# /api/v1 serves the data behind the HTML pages from the same queries.
+# Collections are streamed as a JSON array while rows are read from the
+# database, and every response carries an ETag so a client holding the current
+# version gets a 304 before anything is queried or serialized.
+#----------------------------------------------------------------------------#
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# Items serialized per chunk written to the client.
+STREAM_CHUNK_SIZE = 100
+
+
+def stream_array(items):
+    def generate():
+        chunk = []
+        separator = '['
+        for item in items:
+            chunk.append(separator + json.dumps(item))
+            separator = ','
+            if len(chunk) >= STREAM_CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk = []
+        chunk.append(']' if separator == ',' else '[]')
+        yield ''.join(chunk)
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def conditional(*tags):
+    # Answers If-None-Match with a 304 while none of the tags (formatted
+    # with the view arguments, e.g. 'Venue:{venue_id}') has changed.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = page_cache.etag(*(tag.format(**kwargs) for tag in tags))
+            if etag is not None and request.if_none_match.contains(etag):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            if etag is not None:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
+
+
+def cursor_page(page, *args):
+    try:
+        return jsonify(page(*args, request.args.get('cursor', '')))
+    except ValueError:
+        abort(400)
+
+def browse_filters():
+    # ?genre=Jazz&genre=Blues&match=all|any&city=...&state=...
+    return {
+        'genres': request.args.getlist('genre'),
+        'match': request.args.get('match', 'all'),
+        'city': request.args.get('city') or None,
+        'state': request.args.get('state') or None
+    }
+
+
+def browse_page(model):
+    try:
+        return browse(model, page=max(request.args.get('page', 1, type=int), 1), **browse_filters())
+    except ValueError:
+        abort(400)
+
+def local_datetime(value):
+    # start times are naive local time; a from/to with an offset is
+    # converted to it
+    return naive_local(datetime.fromisoformat(value))
+
+def slots(model, owner_id, **owners):
+    # ?from=2035-04-01&to=2035-04-08T12:00&duration=120, by default the
+    # coming week from today and a standard show length.
+    if model.query.get(owner_id) is None:
+        abort(404)
+    try:
+        if 'from' in request.args:
+            start = local_datetime(request.args['from'])
+        else:
+            start = datetime.combine(datetime.today(), datetime.min.time())
+        if 'to' in request.args:
+            end = local_datetime(request.args['to'])
+        else:
+            end = start + timedelta(days=7)
+        duration = int(request.args.get('duration', SHOW_DURATION))
+        return jsonify({
+            'from': str(start),
+            'to': str(end),
+            'duration': duration,
+            'slots': available_slots(start, end, duration, **owners)
+        })
+    except ValueError:
+        abort(400)
+
+#  Venues
+#  ----------------------------------------------------------------
+
+@api.route('/venues')
+@conditional('Venue', 'Show')
+def venues():
+    return stream_array(iter_venue_directory())
+
+
+@api.route('/venues/browse')
+@conditional('Venue')
+def browse_venues():
+    return jsonify(browse_page(Venue))
+
+
+@api.route('/venues/names')
+def venue_name_completions():
+    # ?q=mus -> [{'id': 1, 'name': 'The Musical Hop'}], for the show form
+    return jsonify(venue_names.complete(request.args.get('q', '')))
+
+
+@api.route('/venues/<int:venue_id>')
+@conditional('Venue:{venue_id}', 'Artist')
+def show_venue(venue_id):
+    venue = venue_details(venue_id)
+    if not venue:
+        abort(404)
+    return jsonify(venue)
+
+
+@api.route('/venues/<int:venue_id>/past_shows')
+@conditional('Venue:{venue_id}', 'Artist')
+def venue_past_shows(venue_id):
+    return cursor_page(past_shows_page, 'venue', venue_id)
+
+@api.route('/venues/<int:venue_id>/available_slots')
+def venue_available_slots(venue_id):
+    # ?artist_id= also leaves out the times that artist is booked elsewhere
+    return slots(Venue, venue_id, venue_id=venue_id, artist_id=request.args.get('artist_id', type=int))
+
+#  Artists
+#  ----------------------------------------------------------------
+
+@api.route('/artists')
+@conditional('Artist')
+def artists():
+    return stream_array(iter_artists())
+
+
+@api.route('/artists/page')
+@conditional('Artist')
+def artists_by_page():
+    return cursor_page(artists_page)
+
+
+@api.route('/artists/browse')
+@conditional('Artist')
+def browse_artists():
+    return jsonify(browse_page(Artist))
+
+
+@api.route('/artists/names')
+def artist_name_completions():
+    return jsonify(artist_names.complete(request.args.get('q', '')))
+
+
+@api.route('/artists/<int:artist_id>')
+@conditional('Artist:{artist_id}', 'Venue')
+def show_artist(artist_id):
+    artist = artist_details(artist_id)
+    if not artist:
+        abort(404)
+    return jsonify(artist)
+
+
+@api.route('/artists/<int:artist_id>/past_shows')
+@conditional('Artist:{artist_id}', 'Venue')
+def artist_past_shows(artist_id):
+    return cursor_page(past_shows_page, 'artist', artist_id)
+
+@api.route('/artists/<int:artist_id>/available_slots')
+def artist_available_slots(artist_id):
+    return slots(Artist, artist_id, artist_id=artist_id)
+
+#  Shows
+#  ----------------------------------------------------------------
+
+@api.route('/shows')
+@conditional('Show', 'Venue', 'Artist')
+def shows():
+    return stream_array(iter_shows())
+
+
+@api.route('/shows/page')
+@conditional('Show', 'Venue', 'Artist')
+def shows_by_page():
+    return cursor_page(shows_page)
+
+
+#  Submissions
+#  ----------------------------------------------------------------
+
+@api.route('/submissions/<token>')
+def submission_status(token):
+    # {'status': 'pending'|'running'|'done'|'failed', 'message': ...} of a
+    # form queued in WRITE_BEHIND mode
+    status = write_behind.status(token) if write_behind.enabled else None
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+
+@api.errorhandler(400)
+def bad_request(error):
+    return jsonify({'success': False, 'error': 400, 'message': 'bad request'}), 400
+
+
+@api.errorhandler(404)
+def not_found(error):
+    return jsonify({'success': False, 'error': 404, 'message': 'resource not found'}), 404
@@ -2,16 +2,26 @@
 # Imports
 #----------------------------------------------------------------------------#
 
-import dateutil.parser
-import babel
 from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify, json, abort
 from flask_moment import Moment
 from flask_migrate import Migrate
-import logging
-from logging import Formatter, FileHandler
 from flask_wtf import Form
+from psycopg2.errorcodes import CHECK_VIOLATION, EXCLUSION_VIOLATION
+from sqlalchemy.exc import DataError, IntegrityError
 from forms import *
 from models import *
+from queries import venue_directory, venue_details, artist_details, past_shows_page, search, artists_page, shows_page
+from commands import shows_cli
+import counters # registers the Show counter listeners
+from cache import page_cache
+from formatting import format_datetime
+from api import api, browse_filters, browse_page
+import database
+from database import query_budget
+from writebehind import write_behind
+from profiling import profiler
+from logs import structured_logging
+import lookups
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -22,8 +32,14 @@ app.config.from_object('config')
 
 # TODO: connect to a local postgresql database
 
-db.init_app(app)
+database.init_app(app)
+profiler.init_app(app)
 migrate = Migrate(app, db)
+app.cli.add_command(shows_cli)
+page_cache.init_app(app)
+write_behind.init_app(app)
+lookups.init_app(app)
+app.register_blueprint(api)
 
 #----------------------------------------------------------------------------#
 # Models.
@@ -33,14 +49,6 @@ migrate = Migrate(app, db)
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  date = dateutil.parser.parse(value)
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
 app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
@@ -48,6 +56,8 @@ app.jinja_env.filters['datetime'] = format_datetime
 #----------------------------------------------------------------------------#
 
 @app.route('/')
+@query_budget(2)
+@page_cache.cached('Venue', 'Artist')
 def index():
   recent_venues = Venue.query.order_by(Venue.created_date.desc()).limit(10).all()
   recent_artists = Artist.query.order_by(Artist.created_date.desc()).limit(10).all()
@@ -57,94 +67,45 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues') # Done
+@query_budget(1)
+@page_cache.cached('Venue', 'Show')
 def venues():
-  city_states = Venue.query.with_entities(Venue.city,Venue.state).distinct().all()
-  result=[]
-  for area in city_states:
-      area_venue = Venue.query.filter(Venue.city==area.city,Venue.state==area.state)
-      venue_show = area_venue.join(Show,Venue.id==Show.venue_id, isouter=True).with_entities(Venue.id,Venue.name,func.count(Show.id).label('num_upcoming_shows')).group_by(Venue.id,Venue.name).all()
-      venues = []
-      for venue in venue_show:
-          venues.append({
-            'id':venue.id,
-            'name':venue.name,
-            'num_upcoming_shows':venue.num_upcoming_shows
-          })
-      result.append({
-        'city':area.city,
-        'state':area.state,
-        'venues':venues
-      })
-
-  #Cleaner solution:
-  #result = []
-  #venues = Venue.query.all()
-  #places = Venue.query.distinct(Venue.city, Venue.state).all()
-  #for place in places:
-  #    tmp_venues = []
-  #    for venue in venues:
-  #        if venue.city == place.city and venue.state == place.state:
-  #            num_upcoming_shows = 0
-  #            for show in venue.shows:
-  #                if show.start_time > datetime.now():
-  #                    num_upcoming_shows += 1
-  #            tmp_venues.append({
-  #                'id': venue.id,
-  #                'name': venue.name,
-  #                'num_upcoming_shows': num_upcoming_shows
-  #            })
-  #    result.append({
-  #        'city': place.city,
-  #        'state': place.state,
-  #        'venues': tmp_venues
-  #    })
-
+  result = venue_directory()
   return render_template('pages/venues.html', areas=result)
 
-@app.route('/venues/search', methods=['POST']) # Done
+@app.route('/venues/search', methods=['GET', 'POST']) # Done
+@query_budget(2)
 def search_venues():
-  search_term=request.form['search_term']
-  venues=Venue.query.filter(or_(Venue.name.ilike(f'%{search_term}%'),(Venue.city + ', ' + Venue.state)==search_term)).all()
-  count=len(venues)
-
-  response={
-    "count": count,
-    "data": venues
-  }
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term=request.values.get('search_term', '')
+  page=request.args.get('page', 1, type=int)
+  response=search(Venue, search_term, max(page, 1))
+  return render_template('pages/search_venues.html', results=response, search_term=search_term)
+
+@app.route('/venues/browse')
+@query_budget(2)
+@page_cache.cached('Venue')
+def browse_venues():
+  return render_template('pages/browse.html', results=browse_page(Venue), filters=browse_filters(),
+    title='Venues', kind='venues', icon='fa-music', endpoint='browse_venues')
 
 @app.route('/venues/<int:venue_id>') # Done
+@query_budget(2)
 def show_venue(venue_id):
-  venue_info = Venue.query.get(venue_id)
-  if not venue_info:
+  result = venue_details(venue_id)
+  if not result:
     abort(404)
-  upcoming_shows = venue_info.shows.join(Artist,Artist.id==Show.artist_id).filter(Show.start_time>func.now()).with_entities(Show.artist_id,Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'),Show.start_time).all()
-  past_shows = venue_info.shows.join(Artist,Artist.id==Show.artist_id).filter(Show.start_time<=func.now()).with_entities(Show.artist_id,Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'),Show.start_time).all()
-  
-  upcoming_shows_count = len(upcoming_shows)
-  past_shows_count = len(past_shows)
-
-  result = {
-    "id":venue_info.id,
-    "name":venue_info.name,
-    "city":venue_info.city,
-    "state":venue_info.state,
-    "address":venue_info.address,
-    "phone":venue_info.phone,
-    "genres":venue_info.genres,
-    "image_link":venue_info.image_link,
-    "facebook_link":venue_info.facebook_link,
-    "website":venue_info.website,
-    "seeking_talent":venue_info.seeking_talent,
-    "seeking_description":venue_info.seeking_description,
-    "upcoming_shows_count":upcoming_shows_count,
-    "past_shows_count":past_shows_count,
-    "upcoming_shows":upcoming_shows,
-    "past_shows":past_shows
-  }
 
   return render_template('pages/show_venue.html', venue=result)
 
+@app.route('/venues/<int:venue_id>/past_shows')
+def venue_past_shows(venue_id):
+  # "load more" for the past shows section of the venue page
+  try:
+    page = past_shows_page('venue', venue_id, request.args.get('cursor', ''))
+  except ValueError:
+    abort(400)
+  return jsonify(page)
+
 #  Create Venue
 #  ----------------------------------------------------------------
 
@@ -153,26 +114,30 @@ def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
+def venue_fields(form):
+  return dict(
+    name=form.name.data,
+    city=form.city.data,
+    state=form.state.data,
+    address=form.address.data,
+    phone=form.phone.data,
+    genres=form.genres.data,
+    image_link=form.image_link.data,
+    facebook_link=form.facebook_link.data,
+    website=form.website_link.data,
+    seeking_talent=form.seeking_talent.data,
+    seeking_description=form.seeking_description.data
+  )
+
 @app.route('/venues/create', methods=['POST']) # Done
 def create_venue_submission():
   form=VenueForm(request.form)
+  if write_behind.enabled:
+    return queue_submission('venue', form, venue_fields(form), 'Venue ' + form.name.data)
   error=False
 
   try:
-    data = Venue(
-      name=form.name.data,
-      city=form.city.data,
-      state=form.state.data,
-      address=form.address.data,
-      phone=form.phone.data,
-      genres=form.genres.data,
-      image_link=form.image_link.data,
-      facebook_link=form.facebook_link.data,
-      website=form.website_link.data,
-      seeking_talent=form.seeking_talent.data,
-      seeking_description=form.seeking_description.data,
-      created_date=func.now()
-      )
+    data = Venue(created_date=func.now(), **venue_fields(form))
     db.session.add(data)
     db.session.commit()
   except ValueError as e:
@@ -180,8 +145,6 @@ def create_venue_submission():
     if app.config["ENV"] == "development":
         print(e)
     db.session.rollback()
-  finally:
-    db.session.close()
   if error:
     flash('An error occurred. Venue ' + form.name.data + ' could not be listed.')    
   else:
@@ -200,62 +163,54 @@ def delete_venue(venue_id):
   except:
     error=True
     db.session.rollback()
-  finally:
-    db.session.close()
   return render_template('pages/home.html')
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists') # Done
+@query_budget(1)
+@page_cache.cached('Artist')
 def artists():
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  try:
+    page = artists_page(request.args.get('cursor'))
+  except ValueError:
+    abort(400)
+  return render_template('pages/artists.html', artists=page['data'], page=page)
 
-@app.route('/artists/search', methods=['POST']) # Done
+@app.route('/artists/search', methods=['GET', 'POST']) # Done
+@query_budget(2)
 def search_artists():
-  search_term=request.form['search_term']
-  artists=Artist.query.filter(or_(Artist.name.ilike(f'%{search_term}%'),(Artist.city + ', ' + Artist.state) == search_term)).all()
-  count=len(artists)
-
-  response={
-    "count": count,
-    "data": artists
-  }
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+  search_term=request.values.get('search_term', '')
+  page=request.args.get('page', 1, type=int)
+  response=search(Artist, search_term, max(page, 1))
+  return render_template('pages/search_artists.html', results=response, search_term=search_term)
+
+@app.route('/artists/browse')
+@query_budget(2)
+@page_cache.cached('Artist')
+def browse_artists():
+  return render_template('pages/browse.html', results=browse_page(Artist), filters=browse_filters(),
+    title='Artists', kind='artists', icon='fa-users', endpoint='browse_artists')
 
 @app.route('/artists/<int:artist_id>') # Done
+@query_budget(2)
 def show_artist(artist_id):
-  artist_info = Artist.query.get(artist_id)
+  data = artist_details(artist_id)
 
-  if not artist_info:
+  if not data:
     return not_found_error(0)
-  
-  upcoming_shows = artist_info.shows.join(Venue,Venue.id==Show.venue_id).filter(Show.start_time>func.now()).with_entities(Show.venue_id,Venue.name.label('venue_name'),Venue.image_link.label('venue_image_link'),Show.start_time).all()
-  past_shows = artist_info.shows.join(Venue,Venue.id==Show.venue_id).filter(Show.start_time<=func.now()).with_entities(Show.venue_id,Venue.name.label('venue_name'),Venue.image_link.label('venue_image_link'),Show.start_time).all()
-
-  upcoming_shows_count = len(upcoming_shows)
-  past_shows_count = len(past_shows)
-  
-  data={
-    "id": artist_info.id,
-    "name": artist_info.name,
-    "genres": artist_info.genres,
-    "city": artist_info.city,
-    "state": artist_info.state,
-    "phone": artist_info.phone,
-    "website": artist_info.website,
-    "facebook_link": artist_info.facebook_link,
-    "seeking_venue": artist_info.seeking_venue,
-    "seeking_description": artist_info.seeking_description,
-    "image_link": artist_info.image_link,
-    "past_shows": past_shows,
-    "upcoming_shows": upcoming_shows,
-    "past_shows_count": past_shows_count,
-    "upcoming_shows_count": upcoming_shows_count
-  }
 
   return render_template('pages/show_artist.html', artist=data)
 
+@app.route('/artists/<int:artist_id>/past_shows')
+def artist_past_shows(artist_id):
+  # "load more" for the past shows section of the artist page
+  try:
+    page = past_shows_page('artist', artist_id, request.args.get('cursor', ''))
+  except ValueError:
+    abort(400)
+  return jsonify(page)
+
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET']) # Done
@@ -287,8 +242,6 @@ def edit_artist_submission(artist_id):
     if app.config["ENV"] == "development":
         print(e)
     db.session.rollback()
-  finally:
-    db.session.close()
   if error:
     return abort(500)
 
@@ -324,8 +277,6 @@ def edit_venue_submission(venue_id):
     if app.config["ENV"] == "development":
         print(e)
     db.session.rollback()
-  finally:
-    db.session.close()
   if error:
     return abort(500)
 
@@ -339,25 +290,29 @@ def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
+def artist_fields(form):
+  return dict(
+    name=form.name.data,
+    city=form.city.data,
+    state=form.state.data,
+    phone=form.phone.data,
+    genres=form.genres.data,
+    image_link=form.image_link.data,
+    facebook_link=form.facebook_link.data,
+    website=form.website_link.data,
+    seeking_venue=form.seeking_venue.data,
+    seeking_description=form.seeking_description.data
+  )
+
 @app.route('/artists/create', methods=['POST']) # Done
 def create_artist_submission():
   form=ArtistForm(request.form)
+  if write_behind.enabled:
+    return queue_submission('artist', form, artist_fields(form), 'Artist ' + form.name.data)
   error=False
 
   try:
-    artist=Artist(
-      name=form.name.data,
-      city=form.city.data,
-      state=form.city.data,
-      phone=form.phone.data,
-      genres=form.genres.data,
-      image_link=form.image_link.data,
-      facebook_link=form.facebook_link.data,
-      website=form.website_link.data,
-      seeking_venue=form.seeking_venue.data,
-      seeking_description=form.seeking_description.data,
-      created_date=func.now()
-    )
+    artist=Artist(created_date=func.now(), **artist_fields(form))
     db.session.add(artist)
     db.session.commit()
   except ValueError as e:
@@ -377,9 +332,14 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows') # Done
+@query_budget(1)
+@page_cache.cached('Show', 'Venue', 'Artist')
 def shows():
-  data = Show.query.join(Artist,Artist.id==Show.artist_id).join(Venue,Venue.id==Show.venue_id).with_entities(Show.venue_id,Venue.name.label('venue_name'),Show.artist_id,Artist.name.label('artist_name'),Artist.image_link.label('artist_image_link'),Show.start_time).order_by(Show.start_time.asc()).all()
-  return render_template('pages/shows.html', shows=data)
+  try:
+    page = shows_page(request.args.get('cursor'))
+  except ValueError:
+    abort(400)
+  return render_template('pages/shows.html', shows=page['data'], page=page)
 
 @app.route('/shows/create') # Done
 def create_shows():
@@ -391,29 +351,74 @@ def create_shows():
 def create_show_submission():
   # called to create new shows in the db, upon submitting new show listing form
   # TODO: insert form data as a new Show record in the db, instead
-  artist_id = request.form['artist_id']
-  venue_id = request.form['venue_id']
+  if write_behind.enabled:
+    form = ShowForm(request.form)
+    # the start time is parsed by the database, as below
+    return queue_submission('show', form, {
+      'artist_id': form.artist_id.data,
+      'venue_id': form.venue_id.data,
+      'start_time': request.form.get('start_time', ''),
+      'duration': form.duration.data or SHOW_DURATION
+    }, 'Show', form.validate_lenient)
+  form = ShowForm(request.form)
+  if not form.validate_lenient():
+    flash('An error has occurred. ' + form.errors_text() + ' Show was not listed.')
+    return render_template('pages/home.html')
+  artist_id = form.artist_id.data
+  venue_id = form.venue_id.data
   start_time = request.form['start_time']
+  duration = form.duration.data or SHOW_DURATION
 
   error=False
+  double_booked=False
 
   try:
-    new_show = Show(artist_id=artist_id,venue_id=venue_id,start_time=start_time)
+    new_show = Show(artist_id=artist_id,venue_id=venue_id,start_time=start_time,duration=duration)
     db.session.add(new_show)
     db.session.commit()
-  except ValueError as e:
+  except (ValueError, DataError) as e:
     error=True
     print(e)
     db.session.rollback()
-  finally:
-    db.session.close()
-  if error:
+  except IntegrityError as e:
+    # the booking constraints reject overlapping shows, the check
+    # constraint a duration that isn't positive
+    if e.orig.pgcode == EXCLUSION_VIOLATION:
+      double_booked=True
+    elif e.orig.pgcode == CHECK_VIOLATION:
+      error=True
+    else:
+      raise
+    db.session.rollback()
+  if double_booked:
+    flash('The venue or the artist is already booked at that time. Show was not listed.')
+  elif error:
     flash('An error has occurred. Show was not listed.')
   else:
     flash('Show was successfully listed!')
   
   return render_template('pages/home.html')
 
+#  Write-behind submissions
+#  ----------------------------------------------------------------
+
+def queue_submission(kind, form, fields, name, validate=None):
+  # WRITE_BEHIND mode: queue the form for the write-behind workers and
+  # return straight away; the home page polls the submission's status.
+  if not (validate or form.validate)():
+    flash('An error occurred. ' + name + ' could not be listed.')
+    return render_template('pages/home.html')
+  token = write_behind.enqueue(kind, fields)
+  flash(name + ' was received and will be listed shortly.')
+  return render_template('pages/home.html', submission_url=url_for('api.submission_status', token=token))
+
+#  Metrics
+#  ----------------------------------------------------------------
+
+@app.route('/metrics')
+def metrics():
+  return Response(database.pool_metrics(), mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -422,15 +427,7 @@ def not_found_error(error):
 def server_error(error):
     return render_template('errors/500.html'), 500
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
+structured_logging.init_app(app)
 
 #----------------------------------------------------------------------------#
 # Launch.
@@ -0,0 +1,77 @@
+#----------------------------------------------------------------------------#
+# Date formatting benchmark.
+#
+# Formats the start times of a /shows-sized listing with the old `datetime`
+# filter and with formatting.format_datetime, for both datetime and string
+# inputs. No database needed:
+#
+#   python -m benchmarks.formatting --rows 5000 --distinct 500
+#----------------------------------------------------------------------------#
+
+import argparse
+import random
+import time
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+
+from formatting import format_datetime, _format_datetime
+
+
+def legacy_format_datetime(value, format='medium'):
+    # what app.py registered as the `datetime` filter
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def start_times(rows, distinct):
+    # Shows cluster on a limited set of evening slots, like a real listing.
+    rng = random.Random(0)
+    first = datetime(2021, 1, 1, 20, 0)
+    slots = [first + timedelta(days=rng.randrange(365), minutes=30 * rng.randrange(6))
+             for _ in range(distinct)]
+    return sorted(rng.choice(slots) for _ in range(rows))
+
+
+def measure(label, run, values, renders, cold=False):
+    elapsed = 0
+    for _ in range(renders):
+        if cold:
+            _format_datetime.cache_clear()
+        started = time.perf_counter()
+        for value in values:
+            run(value, 'full')
+        elapsed += time.perf_counter() - started
+    elapsed = elapsed * 1000 / renders
+    print('{:<22} {:>9.2f} ms per render'.format(label, elapsed))
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Fyyur datetime filter.')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--distinct', type=int, default=500)
+    parser.add_argument('--renders', type=int, default=5)
+    args = parser.parse_args()
+
+    datetimes = start_times(args.rows, args.distinct)
+    strings = [str(value) for value in datetimes]
+    for value in datetimes + strings:
+        assert format_datetime(value, 'full') == legacy_format_datetime(str(value), 'full')
+
+    before = measure('before (str)', legacy_format_datetime, strings, args.renders)
+    # the old filter only accepted strings, so it can't be timed on datetimes
+    measure('after (str, cold)', format_datetime, strings, args.renders, cold=True)
+    after_strings = measure('after (str)', format_datetime, strings, args.renders)
+    after_datetimes = measure('after (datetime)', format_datetime, datetimes, args.renders)
+    print('speedup {:.1f}x (str), {:.1f}x (datetime)'.format(
+        before / after_strings, before / after_datetimes))
+
+
+if __name__ == '__main__':
+    main()
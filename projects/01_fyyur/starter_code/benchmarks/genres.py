@@ -0,0 +1,100 @@
+#----------------------------------------------------------------------------#
+# Genre browse benchmark.
+#
+# Seeds the database with synthetic venues whose genres follow a skewed
+# distribution (a few common genres, a long tail of rare ones), then times
+# genre browse queries with the GIN index on Venue.genres and, inside a rolled
+# back transaction, without it. The plan of a rare genre lookup is printed to
+# show the index is used:
+#
+#   python -m benchmarks.genres --venues 500000 --database-url postgresql://...
+#----------------------------------------------------------------------------#
+
+import argparse
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db, Venue
+from queries import browse
+from benchmarks.search import AREAS, SEED_BATCH, sql_array, percentile
+
+# Most common first: the n-th genre is picked roughly n^-2 as often as the first.
+GENRES = ['Rock n Roll', 'Pop', 'Jazz', 'Hip-Hop', 'Electronic', 'Folk', 'Blues',
+          'Country', 'Alternative', 'Soul', 'Punk', 'R&B', 'Classical', 'Funk',
+          'Heavy Metal', 'Reggae', 'Instrumental', 'Musical Theatre', 'Other']
+
+FILTERS = [
+    {'genres': ['Jazz']},
+    {'genres': ['Jazz'], 'city': 'San Francisco', 'state': 'CA'},
+    {'genres': ['Jazz', 'Blues'], 'match': 'all'},
+    {'genres': ['Reggae', 'Funk'], 'match': 'any'},
+    {'genres': ['Musical Theatre']},
+    {'genres': ['Instrumental'], 'city': 'Austin', 'state': 'TX'},
+]
+
+
+def seed(total):
+    existing = db.session.query(db.func.count(Venue.id)).scalar()
+    db.session.execute(text('SELECT setseed(0.42)'))
+    for start in range(existing + 1, total + 1, SEED_BATCH):
+        stop = min(start + SEED_BATCH - 1, total)
+        db.session.execute(text('''
+INSERT INTO "Venue" (name, city, state, genres, seeking_talent, created_date)
+SELECT 'Venue ' || i, cities[1 + i % {areas}], states[1 + i % {areas}],
+       ARRAY(SELECT DISTINCT genres[1 + floor({genres} * power(random(), 3))::int]
+             FROM generate_series(0, i % 3)),
+       false, now()
+FROM generate_series(:start, :stop) AS i,
+     (SELECT {genres_array} AS genres, {cities_array} AS cities, {states_array} AS states) AS seed
+'''.format(
+            areas=len(AREAS), genres=len(GENRES),
+            genres_array=sql_array(genre.replace("'", "''") for genre in GENRES),
+            cities_array=sql_array(city for city, state in AREAS),
+            states_array=sql_array(state for city, state in AREAS))), {'start': start, 'stop': stop})
+        db.session.commit()
+        print('seeded {} venues'.format(stop))
+    db.session.execute(text('ANALYZE "Venue"'))
+    db.session.commit()
+
+
+def plan(query):
+    statement = query.statement.compile(dialect=db.engine.dialect)
+    return [row[0] for row in db.session.connection().exec_driver_sql('EXPLAIN ' + str(statement), statement.params)]
+
+
+def measure(label, repeat):
+    latencies = []
+    for _ in range(repeat):
+        for filters in FILTERS:
+            started = time.perf_counter()
+            browse(Venue, **filters)
+            latencies.append((time.perf_counter() - started) * 1000)
+    print('{:<14} p50 {:>9.2f} ms   p99 {:>9.2f} ms'.format(
+        label, percentile(latencies, 0.50), percentile(latencies, 0.99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Fyyur genre browse.')
+    parser.add_argument('--venues', type=int, default=500000)
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--database-url', default=app.config['SQLALCHEMY_DATABASE_URI'])
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    with app.app_context():
+        db.create_all()
+        seed(args.venues)
+
+        rare = db.session.query(Venue.id).filter(Venue.genres.contains(['Musical Theatre']))
+        print('\n'.join(plan(rare)))
+        measure('with index', args.repeat)
+
+        db.session.execute(text('DROP INDEX "ix_Venue_genres"'))
+        measure('without index', args.repeat)
+        db.session.rollback()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+#----------------------------------------------------------------------------#
+# Venue search benchmark.
+#
+# Seeds the database with synthetic venues and compares the latency of the
+# old `name ILIKE '%term%'` / `city || ', ' || state` search against the
+# ranked full-text search in queries.py:
+#
+#   python -m benchmarks.search --venues 1000000 --database-url postgresql://...
+#----------------------------------------------------------------------------#
+
+import argparse
+import random
+import time
+
+from sqlalchemy import text
+
+from app import app
+from models import db, Venue, or_
+from queries import search
+
+WORDS = ['Musical', 'Hop', 'Dueling', 'Pianos', 'Park', 'Square', 'Live', 'Jazz',
+         'Corner', 'Blue', 'Note', 'Velvet', 'Room', 'Hall', 'Garden', 'Tavern',
+         'Lounge', 'Cellar', 'Warehouse', 'Theatre']
+AREAS = [('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX'), ('Chicago', 'IL'),
+         ('Seattle', 'WA'), ('Nashville', 'TN'), ('Denver', 'CO'), ('Boston', 'MA')]
+GENRES = ['Jazz', 'Blues', 'Folk', 'Rock n Roll', 'Classical', 'Hip-Hop', 'Soul', 'Funk']
+# Three of these make up the rarer, name-specific word of each venue.
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'to', 'vi', 'be', 'da', 'fe', 'go',
+             'ha', 'ji', 'ko', 'lu', 'ma', 'no', 'pe', 'ri', 'su', 'ta', 'wo', 'ze']
+
+SEED_BATCH = 100000
+
+
+def sql_array(values):
+    return 'ARRAY[{}]'.format(', '.join("'{}'".format(value) for value in values))
+
+
+def seed(total):
+    existing = db.session.query(db.func.count(Venue.id)).scalar()
+    for start in range(existing + 1, total + 1, SEED_BATCH):
+        stop = min(start + SEED_BATCH - 1, total)
+        db.session.execute(text('''
+INSERT INTO "Venue" (name, city, state, genres, seeking_talent, created_date)
+SELECT words[1 + i % {words}] || ' ' || initcap(
+         syllables[1 + i % {syllables}] || syllables[1 + (i / {syllables}) % {syllables}] ||
+         syllables[1 + (i / {syllables} / {syllables}) % {syllables}]) || ' ' || words[1 + (i / 7) % {words}],
+       cities[1 + i % {areas}], states[1 + i % {areas}],
+       ARRAY[genres[1 + i % {genres}], genres[1 + (i / {genres}) % {genres}]],
+       false, now()
+FROM generate_series(:start, :stop) AS i,
+     (SELECT {words_array} AS words, {syllables_array} AS syllables, {cities_array} AS cities,
+             {states_array} AS states, {genres_array} AS genres) AS seed
+'''.format(
+            words=len(WORDS), syllables=len(SYLLABLES), areas=len(AREAS), genres=len(GENRES),
+            words_array=sql_array(WORDS),
+            syllables_array=sql_array(SYLLABLES),
+            cities_array=sql_array(city for city, state in AREAS),
+            states_array=sql_array(state for city, state in AREAS),
+            genres_array=sql_array(GENRES))), {'start': start, 'stop': stop})
+        db.session.commit()
+        print('seeded {} venues'.format(stop))
+    db.session.execute(text('ANALYZE "Venue"'))
+    db.session.commit()
+
+
+def legacy_search(search_term):
+    # what search_venues() used to run
+    return Venue.query.filter(or_(Venue.name.ilike(f'%{search_term}%'), (Venue.city + ', ' + Venue.state) == search_term)).all()
+
+
+def terms(count):
+    rng = random.Random(0)
+    result = []
+    for i in range(count):
+        if i % 4 == 0:
+            result.append('{}, {}'.format(*rng.choice(AREAS)))
+        elif i % 4 == 1:
+            result.append(' '.join(rng.sample(WORDS, 2)))
+        else:
+            result.append(''.join(rng.choice(SYLLABLES) for _ in range(3)))
+    return result
+
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(label, run, search_terms):
+    latencies = []
+    for search_term in search_terms:
+        started = time.perf_counter()
+        run(search_term)
+        latencies.append((time.perf_counter() - started) * 1000)
+        db.session.rollback()
+    print('{:<10} p50 {:>9.2f} ms   p99 {:>9.2f} ms'.format(
+        label, percentile(latencies, 0.50), percentile(latencies, 0.99)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Fyyur venue search.')
+    parser.add_argument('--venues', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--database-url', default=app.config['SQLALCHEMY_DATABASE_URI'])
+    args = parser.parse_args()
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = args.database_url
+    with app.app_context():
+        db.create_all()
+        seed(args.venues)
+        search_terms = terms(args.queries)
+        measure('before', legacy_search, search_terms)
+        measure('after', lambda search_term: search(Venue, search_term), search_terms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from flask import current_app, request, session
+from sqlalchemy import event
+
+from models import db, Venue, Artist, Show
+from routing import pinned_to_primary, use_replica
+
+#----------------------------------------------------------------------------#
+# Page cache.
+#
+# Rendered pages are stored under their URL together with the tags of the
+# data they were built from ('Venue', 'Venue:3', 'Show', ...). Committing a
+# session that touched one of those entities drops every page carrying the
+# matching tag, so a hit costs one lookup and never serves data older than the
+# last commit. Entries also expire after CACHE_DEFAULT_TIMEOUT seconds, which
+# bounds staleness for changes made outside this process's sessions. With a
+# read replica, pages read from it within READ_YOUR_WRITES_SECONDS of an
+# invalidation aren't stored, since the replica may not have the write yet.
+#----------------------------------------------------------------------------#
+
+class NullBackend(object):
+    def get(self, key):
+        return None
+
+    def set(self, key, value, tags, timeout, generation):
+        pass
+
+    def invalidate(self, tags):
+        pass
+
+    def generation(self):
+        return 0
+
+    def invalidated_at(self):
+        return 0
+
+    def versions(self, tags):
+        return None
+
+    def clear(self):
+        pass
+
+
+class LRUBackend(object):
+    # In-process store, bounded to max_entries, least recently used first out.
+
+    def __init__(self, max_entries=500):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generation = 0
+        self._invalidated_at = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value, tags = entry
+            if expires < time.time():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, tags, timeout, generation):
+        with self._lock:
+            # something was invalidated while the page rendered
+            if generation != self._generation:
+                return
+            self._drop(key)
+            self._entries[key] = (time.time() + timeout, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tags):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = time.time()
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    self._drop(key)
+
+    def generation(self):
+        return self._generation
+
+    def invalidated_at(self):
+        return self._invalidated_at
+
+    def versions(self, tags):
+        # Only the writing process would see its commits move a version on,
+        # so other workers would keep answering 304 with stale data: no
+        # validators from a per-process cache.
+        return None
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._invalidated_at = time.time()
+            self._entries.clear()
+            self._tags.clear()
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+
+class FileBackend(object):
+    # Entries as files under `directory`, shared by every worker on the host.
+    # tags/<tag>/ holds one marker per entry carrying that tag, and the
+    # `generation` file a counter bumped by every invalidation.
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, 'tags'), exist_ok=True)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires < time.time():
+            self._remove(self._path(key))
+            return None
+        return value
+
+    def set(self, key, value, tags, timeout, generation):
+        if generation != self.generation():
+            return
+        name = self._name(key)
+        for tag in tags:
+            tag_directory = self._tag_path(tag)
+            os.makedirs(tag_directory, exist_ok=True)
+            open(os.path.join(tag_directory, name), 'w').close()
+        temporary = '{}.{}.tmp'.format(self._path(key), os.getpid())
+        with open(temporary, 'wb') as f:
+            pickle.dump((time.time() + timeout, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary, self._path(key))
+        # An invalidation that ran since the check above may have looked for
+        # the markers or the entry before they were written. It bumps the
+        # generation before removing anything, so checking again catches it.
+        if generation != self.generation():
+            self._remove(self._path(key))
+
+    def invalidate(self, tags):
+        self._bump_generation()
+        for tag in tags:
+            tag_directory = self._tag_path(tag)
+            try:
+                names = os.listdir(tag_directory)
+            except OSError:
+                continue
+            for name in names:
+                self._remove(os.path.join(self.directory, name))
+                self._remove(os.path.join(tag_directory, name))
+
+    def generation(self):
+        try:
+            with open(os.path.join(self.directory, 'generation')) as f:
+                return int(f.read() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def invalidated_at(self):
+        # the generation file is rewritten by every invalidation
+        try:
+            return os.stat(os.path.join(self.directory, 'generation')).st_mtime
+        except OSError:
+            return 0
+
+    def versions(self, tags):
+        # one version shared by every tag: coarser, but the same in every worker
+        return str(self.generation())
+
+    def clear(self):
+        self._bump_generation()
+        for root, directories, files in os.walk(self.directory, topdown=False):
+            for name in files:
+                if root != self.directory or name not in ('generation', 'generation.lock'):
+                    self._remove(os.path.join(root, name))
+
+    def _bump_generation(self):
+        # Replaced rather than rewritten in place, so readers never see a
+        # half-written counter.
+        path = os.path.join(self.directory, 'generation')
+        temporary = '{}.{}.tmp'.format(path, os.getpid())
+        with self._generation_lock():
+            with open(temporary, 'w') as f:
+                f.write(str(self.generation() + 1))
+            os.replace(temporary, path)
+
+    @contextmanager
+    def _generation_lock(self):
+        # serializes bumps across workers, so none is lost
+        with open(os.path.join(self.directory, 'generation.lock'), 'a+b') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                yield
+                return
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _name(self, key):
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, self._name(key))
+
+    def _tag_path(self, tag):
+        return os.path.join(self.directory, 'tags', hashlib.sha1(tag.encode()).hexdigest())
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class PageCache(object):
+
+    def __init__(self, app=None):
+        self.backend = NullBackend()
+        self.timeout = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'file')
+        if cache_type == 'lru':
+            self.backend = LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 500))
+        elif cache_type == 'file':
+            self.backend = FileBackend(app.config.get('CACHE_DIR', os.path.join(app.root_path, '.cache')))
+        elif cache_type == 'null':
+            self.backend = NullBackend()
+        else:
+            raise ValueError('Unknown CACHE_TYPE: {}'.format(cache_type))
+        self.timeout = app.config.get('CACHE_DEFAULT_TIMEOUT', 300)
+
+    def cached(self, *tags):
+        # Caches a GET view's rendered body under its URL. Requests with
+        # pending flash messages are rendered normally, since the layout
+        # includes them.
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                if request.method != 'GET' or '_flashes' in session or pinned_to_primary():
+                    return view(*args, **kwargs)
+                key = request.full_path
+                page = self.backend.get(key)
+                if page is None:
+                    generation = self.backend.generation()
+                    page = view(*args, **kwargs)
+                    if isinstance(page, str) and not self.replica_may_lag():
+                        self.backend.set(key, page, tags, self.timeout, generation)
+                return page
+            return wrapper
+        return decorator
+
+    def etag(self, *tags):
+        # A validator for the current request that changes as soon as data
+        # carrying one of the tags is committed. Like cached pages, it is
+        # also renewed every CACHE_DEFAULT_TIMEOUT seconds. None unless the
+        # backend keeps versions every worker shares (CACHE_TYPE 'file'),
+        # and for requests that may not see the latest writes.
+        if pinned_to_primary() or self.replica_may_lag():
+            return None
+        versions = self.backend.versions(tags)
+        if versions is None:
+            return None
+        period = int(time.time() // self.timeout)
+        return hashlib.sha1('{} {} {}'.format(request.full_path, versions, period).encode()).hexdigest()
+
+    def replica_may_lag(self):
+        # the request reads from the replica soon after a write
+        window = current_app.config.get('READ_YOUR_WRITES_SECONDS', 0)
+        return use_replica() and time.time() - self.backend.invalidated_at() < window
+
+    def invalidate(self, *tags):
+        self.backend.invalidate(tags)
+
+    def clear(self):
+        self.backend.clear()
+
+
+page_cache = PageCache()
+
+#----------------------------------------------------------------------------#
+# Invalidation.
+#----------------------------------------------------------------------------#
+
+def tags_for(instance):
+    if isinstance(instance, Show):
+        return ('Show', 'Venue:{}'.format(instance.venue_id), 'Artist:{}'.format(instance.artist_id))
+    if isinstance(instance, (Venue, Artist)):
+        name = type(instance).__name__
+        return (name, '{}:{}'.format(name, instance.id))
+    return ()
+
+
+def tag_changes(db_session, *tags):
+    # For writes the ORM can't see, e.g. bulk UPDATE statements.
+    db_session.info.setdefault('page_cache_tags', set()).update(tags)
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_changed_tags(db_session, flush_context):
+    for instance in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        tag_changes(db_session, *tags_for(instance))
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_pages(db_session):
+    tags = db_session.info.pop('page_cache_tags', None)
+    if tags:
+        page_cache.invalidate(*tags)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_changed_tags(db_session):
+    db_session.info.pop('page_cache_tags', None)
@@ -0,0 +1,60 @@
+import os
+import time
+
+import click
+from flask.cli import AppGroup
+
+from counters import rollover_shows, reconcile_show_counts
+from importer import import_shows, IMPORT_BATCH_SIZE
+
+#----------------------------------------------------------------------------#
+# CLI.
+#
+# Registered on the app next to Flask-Migrate's `flask db`:
+#
+#   flask shows rollover [--interval SECONDS]
+#   flask shows reconcile
+#   flask shows import FILE [--format csv|jsonl] [--batch-size N] [--errors FILE]
+#----------------------------------------------------------------------------#
+
+shows_cli = AppGroup('shows', help='Maintain shows and their counters.')
+
+
+@shows_cli.command('rollover')
+@click.option('--interval', type=int, default=None,
+              help='Keep running, rolling shows over every INTERVAL seconds.')
+def rollover_command(interval):
+    """Move shows that have started from upcoming to past counters."""
+    while True:
+        moved = rollover_shows()
+        click.echo('{} shows rolled over'.format(moved))
+        if interval is None:
+            break
+        time.sleep(interval)
+
+
+@shows_cli.command('reconcile')
+def reconcile_command():
+    """Rebuild every venue and artist show counter from the Show table."""
+    reconcile_show_counts()
+    click.echo('Show counters rebuilt')
+
+
+@shows_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, default=IMPORT_BATCH_SIZE, show_default=True)
+@click.option('--errors', type=click.File('w', encoding='utf-8'), default=None,
+              help='Write rejected rows here instead of stderr.')
+def import_command(path, fmt, batch_size, errors):
+    """Bulk insert shows from a CSV or JSON lines file."""
+    if fmt is None:
+        fmt = 'jsonl' if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson') else 'csv'
+
+    def report(line_number, message):
+        click.echo('{}:{}: {}'.format(path, line_number, message), file=errors, err=errors is None)
+
+    with open(path, newline='', encoding='utf-8') as source:
+        imported, rejected = import_shows(source, fmt, batch_size, report)
+    click.echo('{} shows imported, {} rejected'.format(imported, rejected))
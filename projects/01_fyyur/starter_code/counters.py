@@ -0,0 +1,149 @@
+from collections import Counter
+from datetime import datetime
+
+import dateutil.parser
+from sqlalchemy import event, update, select, bindparam, func
+from sqlalchemy.dialects.postgresql import ARRAY
+
+from models import db, Venue, Artist, Show, Area
+from cache import tag_changes
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#
+# Venue and Artist carry upcoming_shows_count/past_shows_count so listing
+# pages don't have to count shows. Inserting or deleting a Show adjusts them
+# in the same transaction, rollover_shows() moves shows that have started from
+# the upcoming to the past counters, and reconcile_show_counts() rebuilds
+# everything from the Show table. The Area summary follows the venue counters
+# through database triggers (see models.py).
+#----------------------------------------------------------------------------#
+
+def _counter(show):
+    return 'past_shows_count' if show.counted_as_past else 'upcoming_shows_count'
+
+
+def _adjust(connection, show, delta):
+    column = _counter(show)
+    for model, owner_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+        connection.execute(
+            update(model.__table__)
+            .where(model.__table__.c.id == owner_id)
+            .values({column: model.__table__.c[column] + delta})
+        )
+
+
+def naive_local(value):
+    # start times are stored as naive local time, so "...Z" or "+02:00"
+    # times are converted to it
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value
+
+
+@event.listens_for(Show, 'before_insert')
+def classify_new_show(mapper, connection, show):
+    if isinstance(show.start_time, str):
+        show.start_time = dateutil.parser.parse(show.start_time)
+    show.start_time = naive_local(show.start_time)
+    show.counted_as_past = show.start_time <= datetime.now()
+
+
+@event.listens_for(Show, 'after_insert')
+def count_new_show(mapper, connection, show):
+    _adjust(connection, show, 1)
+
+
+@event.listens_for(Show, 'after_delete')
+def uncount_deleted_show(mapper, connection, show):
+    _adjust(connection, show, -1)
+
+
+def add_to_counters(model, deltas):
+    # Applies {owner_id: (upcoming delta, past delta)} to Venue or Artist
+    # counters with a single UPDATE ... FROM unnest(...) statement.
+    if not deltas:
+        return
+    table = model.__table__
+    owner_ids = list(deltas)
+    changes = select(
+        func.unnest(bindparam('owner_ids', owner_ids, type_=ARRAY(db.Integer))).label('owner_id'),
+        func.unnest(bindparam('upcoming', [deltas[i][0] for i in owner_ids], type_=ARRAY(db.Integer))).label('upcoming'),
+        func.unnest(bindparam('past', [deltas[i][1] for i in owner_ids], type_=ARRAY(db.Integer))).label('past')
+    ).subquery()
+    db.session.execute(
+        update(table)
+        .where(table.c.id == changes.c.owner_id)
+        .values(
+            upcoming_shows_count=table.c.upcoming_shows_count + changes.c.upcoming,
+            past_shows_count=table.c.past_shows_count + changes.c.past
+        )
+    )
+
+
+def rollover_shows():
+    # Flags every show that started since the last run as past and moves it
+    # between the counters of its venue and artist, in one transaction.
+    moved = db.session.execute(
+        update(Show)
+        .where(~Show.counted_as_past, Show.start_time <= db.func.now())
+        .values(counted_as_past=True)
+        .returning(Show.venue_id, Show.artist_id)
+        .execution_options(synchronize_session=False)
+    ).fetchall()
+
+    for model, owners in ((Venue, Counter(row.venue_id for row in moved)),
+                          (Artist, Counter(row.artist_id for row in moved))):
+        add_to_counters(model, {owner_id: (-count, count) for owner_id, count in owners.items()})
+    if moved:
+        tag_changes(db.session, 'Show')
+    db.session.commit()
+    return len(moved)
+
+
+def reconcile_show_counts():
+    # Recomputes the flags and every counter from scratch.
+    db.session.execute(
+        update(Show)
+        .where(Show.counted_as_past != (Show.start_time <= db.func.now()))
+        .values(counted_as_past=Show.start_time <= db.func.now())
+        .execution_options(synchronize_session=False)
+    )
+    for model, owner_column in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        def count(counted_as_past):
+            return select(db.func.count(Show.id)).where(
+                owner_column == model.id,
+                Show.counted_as_past.is_(counted_as_past)
+            ).scalar_subquery()
+
+        db.session.execute(
+            update(model)
+            .values(upcoming_shows_count=count(False), past_shows_count=count(True))
+            .execution_options(synchronize_session=False)
+        )
+    rebuild_areas()
+    tag_changes(db.session, 'Show', 'Venue', 'Artist')
+    db.session.commit()
+
+
+def rebuild_areas():
+    # Recomputes the Area summary from Venue, e.g. after venues were written
+    # with the triggers disabled.
+    key = func.area_key(Venue.city, Venue.state)
+    db.session.execute(
+        update(Venue)
+        .where(Venue.area_key.is_distinct_from(key))
+        .values(area_key=key)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.execute(Area.__table__.delete())
+    db.session.execute(Area.__table__.insert().from_select(
+        ['area_key', 'city', 'state', 'venue_count', 'upcoming_shows_count'],
+        select(
+            Venue.area_key,
+            func.min(Venue.city),
+            func.min(Venue.state),
+            func.count(Venue.id),
+            func.sum(Venue.upcoming_shows_count)
+        ).group_by(Venue.area_key)
+    ))
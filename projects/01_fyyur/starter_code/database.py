@@ -0,0 +1,155 @@
+import threading
+import time
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+
+import routing
+from models import db
+
+#----------------------------------------------------------------------------#
+# Database setup.
+#
+# Pool and timeout settings come from config.py (and so from the DB_*
+# environment variables), sessions are released once per request, and the
+# pool reports how long requests wait for a connection so it can be sized
+# against the number of gunicorn workers.
+#----------------------------------------------------------------------------#
+
+class MeteredQueuePool(QueuePool):
+    # QueuePool that keeps checkout wait statistics for /metrics.
+
+    def __init__(self, *args, **kwargs):
+        super(MeteredQueuePool, self).__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super(MeteredQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.checkout_timeouts += 1
+            raise
+        waited = time.perf_counter() - started
+        with self._stats_lock:
+            self.checkouts += 1
+            self.checkout_wait_total += waited
+            self.checkout_wait_max = max(self.checkout_wait_max, waited)
+        return connection
+
+
+def engine_options(config):
+    # SQLALCHEMY_ENGINE_OPTIONS for the configured database.
+    if config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return {}
+    options = {
+        'poolclass': MeteredQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+    }
+    if config['DB_STATEMENT_TIMEOUT']:
+        options['connect_args'] = {'options': '-c statement_timeout={}'.format(config['DB_STATEMENT_TIMEOUT'])}
+    return options
+
+
+def remove_session(error=None):
+    # The only place request sessions are closed: rolls back whatever a
+    # failed request left open and returns the connection to the pool.
+    db.session.remove()
+
+
+#----------------------------------------------------------------------------#
+# Query budget.
+#
+# In debug mode every request counts the SQL statements it runs, and one that
+# goes over its route's budget is logged, which is how a new N+1 pattern shows
+# up before it reaches production.
+#----------------------------------------------------------------------------#
+
+def query_budget(statements):
+    # Per-route budget, overriding SQL_QUERY_BUDGET:
+    #
+    #   @app.route('/venues')
+    #   @query_budget(1)
+    #   def venues(): ...
+    def decorator(view):
+        view.query_budget = statements
+        return view
+    return decorator
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and 'sql_statements' in g:
+        g.sql_statements += 1
+
+
+def start_counting():
+    g.sql_statements = 0
+
+
+def check_budget(response):
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', current_app.config['SQL_QUERY_BUDGET'])
+    if g.sql_statements > budget:
+        current_app.logger.warning('%s %s ran %d SQL statements, over its budget of %d',
+                                   request.method, request.path, g.sql_statements, budget)
+    response.headers['X-SQL-Statements'] = str(g.sql_statements)
+    return response
+
+
+def init_app(app):
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    db.init_app(app)
+    routing.init_app(app)
+    app.teardown_request(remove_session)
+    if app.debug:
+        app.before_request(start_counting)
+        app.after_request(check_budget)
+
+
+def pool_metrics():
+    # Prometheus text format, for this worker's pools: fyyur_db_pool_* for the
+    # primary and fyyur_db_replica_pool_* for the read replica.
+    lines = []
+    engines = [('pool', db.engine)]
+    if routing.replica_configured(current_app):
+        engines.append(('replica_pool', db.get_engine(bind=routing.REPLICA_BIND)))
+    for prefix, engine in engines:
+        lines.extend(engine_pool_metrics(prefix, engine.pool))
+    return '\n'.join(lines) + '\n'
+
+
+def engine_pool_metrics(prefix, pool):
+    lines = []
+
+    def metric(name, kind, help, value):
+        lines.append('# HELP fyyur_db_{}_{} {}'.format(prefix, name, help))
+        lines.append('# TYPE fyyur_db_{}_{} {}'.format(prefix, name, kind))
+        lines.append('fyyur_db_{}_{} {}'.format(prefix, name, value))
+
+    if isinstance(pool, QueuePool):
+        metric('size', 'gauge', 'Connections kept open by the pool.', pool.size())
+        metric('in_use', 'gauge', 'Connections checked out right now.', pool.checkedout())
+        metric('idle', 'gauge', 'Connections waiting in the pool.', pool.checkedin())
+        metric('overflow', 'gauge', 'Connections open beyond pool_size.', max(pool.overflow(), 0))
+    if isinstance(pool, MeteredQueuePool):
+        metric('checkouts_total', 'counter', 'Connections handed out.', pool.checkouts)
+        metric('checkout_timeouts_total', 'counter', 'Checkouts that gave up after pool_timeout.', pool.checkout_timeouts)
+        metric('checkout_wait_seconds_total', 'counter', 'Time spent waiting for a connection.',
+               '{:.6f}'.format(pool.checkout_wait_total))
+        metric('checkout_wait_seconds_max', 'gauge', 'Longest wait for a connection.',
+               '{:.6f}'.format(pool.checkout_wait_max))
+    return lines
@@ -5,14 +5,28 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    with settings(warn_only=True):
+        result = local("python test_fyyur.py -v", capture=True)
+    if result.failed and not confirm("Tests failed. Continue?"):
+        abort("Aborted at user request.")
+    benchmark()
+
+
+def benchmark():
+    # fails on a regression against the last accepted run; save a run as the
+    # new baseline with `fab benchmark_baseline`
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m benchmarks.load --baseline benchmarks/baseline.json --output benchmarks/results.json"
         )
-    if result.failed and not confirm("Tests failed. Continue?"):
+    if result.failed and not confirm("Performance regressed. Continue?"):
         abort("Aborted at user request.")
 
 
+def benchmark_baseline():
+    local("python -m benchmarks.load --output benchmarks/baseline.json")
+
+
 def commit():
     message = raw_input("Enter a git commit message: ")
     local("git add . && git commit -am '{}'".format(message))
@@ -40,7 +54,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python test_fyyur.py -v"
     )
 
 
@@ -0,0 +1,50 @@
+from datetime import datetime
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+#----------------------------------------------------------------------------#
+# Date formatting for templates.
+#
+# The `datetime` filter runs once per show on every listing, and the same
+# start times come up again and again. Strings are only parsed when they
+# aren't datetimes already, each (format, locale) pattern is compiled once,
+# and formatted values are memoized in a bounded LRU.
+#----------------------------------------------------------------------------#
+
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+DATETIME_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def compiled_pattern(format, locale):
+    # (DateTimePattern, Locale) for a format name or a raw babel pattern.
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+def parse_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return dateutil.parser.parse(value)
+
+
+@lru_cache(maxsize=DATETIME_CACHE_SIZE)
+def _format_datetime(value, format, locale):
+    date = parse_datetime(value)
+    # babel reads naive datetimes as UTC
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=babel.dates.UTC)
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(date, locale)
+
+
+def format_datetime(value, format='medium', locale='en'):
+    return _format_datetime(value, format, locale)
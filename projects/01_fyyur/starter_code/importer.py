@@ -0,0 +1,172 @@
+import csv
+import json
+from collections import Counter
+from datetime import datetime
+
+import dateutil.parser
+from sqlalchemy.dialects.postgresql import insert
+
+from models import db, Venue, Artist, Show, SHOW_DURATION
+from cache import tag_changes
+from counters import add_to_counters, naive_local
+
+#----------------------------------------------------------------------------#
+# Bulk show import.
+#
+# Streams shows from a CSV (artist_id,venue_id,start_time[,duration] header)
+# or JSON lines file and inserts them batch by batch with multi-row INSERTs,
+# so memory stays flat however long the file is. Each batch is one transaction that also
+# moves the venue and artist show counters. Rows that can't be imported are
+# reported with their line number and skipped.
+#----------------------------------------------------------------------------#
+
+IMPORT_BATCH_SIZE = 5000
+
+
+class KnownIds(object):
+    # Venue or artist ids already checked against the database. Each batch
+    # looks up only the ids it hasn't seen before, in a single query.
+
+    def __init__(self, model):
+        self.model = model
+        self.existing = set()
+        self.missing = set()
+
+    def check(self, ids):
+        unknown = set(ids) - self.existing - self.missing
+        if unknown:
+            found = {row.id for row in db.session.query(self.model.id).filter(self.model.id.in_(unknown))}
+            self.existing |= found
+            self.missing |= unknown - found
+
+    def __contains__(self, owner_id):
+        return owner_id in self.existing
+
+
+def read_rows(stream, fmt):
+    # (line number, raw record) pairs; a record is None when it can't be parsed.
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, record
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_number, record if isinstance(record, dict) else None
+    else:
+        raise ValueError('Unknown import format: {}'.format(fmt))
+
+
+def parse_start_time(value):
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            value = dateutil.parser.parse(value)
+    return naive_local(value)
+
+
+def parse_row(record):
+    if record is None:
+        raise ValueError('unreadable record')
+    try:
+        artist_id = int(record['artist_id'])
+        venue_id = int(record['venue_id'])
+    except KeyError as e:
+        raise ValueError('missing {}'.format(e.args[0]))
+    except (TypeError, ValueError):
+        raise ValueError('artist_id and venue_id must be integers')
+    try:
+        start_time = parse_start_time(record['start_time'])
+    except KeyError:
+        raise ValueError('missing start_time')
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('invalid start_time: {}'.format(record['start_time']))
+    try:
+        duration = int(record.get('duration') or SHOW_DURATION)
+    except (TypeError, ValueError):
+        raise ValueError('duration must be an integer')
+    if duration <= 0:
+        raise ValueError('duration must be positive')
+    return {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time, 'duration': duration}
+
+
+def _count_batch(shows):
+    # Same bookkeeping the Show insert listeners do, once per owner per batch.
+    for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+        deltas = {}
+        for show in shows:
+            upcoming, past = deltas.get(show[key], (0, 0))
+            if show['counted_as_past']:
+                deltas[show[key]] = (upcoming, past + 1)
+            else:
+                deltas[show[key]] = (upcoming + 1, past)
+        add_to_counters(model, deltas)
+
+
+def _insert_batch(batch, venues, artists, report):
+    venues.check(row['venue_id'] for line_number, row in batch)
+    artists.check(row['artist_id'] for line_number, row in batch)
+
+    now = datetime.now()
+    candidates = []
+    for line_number, row in batch:
+        if row['venue_id'] not in venues:
+            report(line_number, 'unknown venue_id {}'.format(row['venue_id']))
+        elif row['artist_id'] not in artists:
+            report(line_number, 'unknown artist_id {}'.format(row['artist_id']))
+        else:
+            row['counted_as_past'] = row['start_time'] <= now
+            candidates.append((line_number, row))
+
+    shows = []
+    if candidates:
+        # Shows overlapping an existing booking (or an earlier row of the
+        # batch) are skipped by the database and left out of RETURNING.
+        returned = Counter(tuple(row) for row in db.session.execute(
+            insert(Show.__table__).values([row for line_number, row in candidates]).on_conflict_do_nothing().returning(
+                Show.venue_id, Show.artist_id, Show.start_time, Show.duration)))
+        for line_number, row in candidates:
+            key = (row['venue_id'], row['artist_id'], row['start_time'], row['duration'])
+            if returned[key]:
+                returned[key] -= 1
+                shows.append(row)
+            else:
+                report(line_number, 'venue or artist already booked at {}'.format(row['start_time']))
+    if shows:
+        _count_batch(shows)
+        tag_changes(db.session, 'Show')
+    db.session.commit()
+    return len(shows)
+
+
+def import_shows(stream, fmt, batch_size=IMPORT_BATCH_SIZE, report=None):
+    # Returns (imported, rejected). `report(line_number, message)` is called
+    # for every rejected row.
+    venues = KnownIds(Venue)
+    artists = KnownIds(Artist)
+    imported = rejected = 0
+
+    def reject(line_number, message):
+        nonlocal rejected
+        rejected += 1
+        if report is not None:
+            report(line_number, message)
+
+    batch = []
+    for line_number, record in read_rows(stream, fmt):
+        try:
+            batch.append((line_number, parse_row(record)))
+        except ValueError as e:
+            reject(line_number, str(e))
+        if len(batch) >= batch_size:
+            imported += _insert_batch(batch, venues, artists, reject)
+            batch = []
+    if batch:
+        imported += _insert_batch(batch, venues, artists, reject)
+    return imported, rejected
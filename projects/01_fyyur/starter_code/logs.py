@@ -0,0 +1,164 @@
+import atexit
+import copy
+import json
+import logging
+import queue
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+from flask import current_app, g, has_request_context, request
+from flask.logging import default_handler
+
+#----------------------------------------------------------------------------#
+# Logging.
+#
+# Request threads never write log files themselves: records go onto an
+# in-memory queue and a listener thread formats them as JSON lines and writes
+# them to LOG_FILE, rotated by size (LOG_MAX_BYTES) or by time
+# (LOG_ROTATE_WHEN). When the queue is full, records are dropped and counted
+# rather than making the request wait. Every request is logged once, with its
+# id (X-Request-Id, taken from the request or generated), route, status,
+# latency, SQL statements and response size; other records logged while it
+# runs carry the same request id.
+#----------------------------------------------------------------------------#
+
+# Attributes of a record that are copied into its JSON line when set.
+REQUEST_FIELDS = ('request_id', 'method', 'route', 'path', 'status', 'latency_ms',
+                  'sql_statements', 'response_size')
+
+
+class JsonFormatter(logging.Formatter):
+
+    def format(self, record):
+        line = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in REQUEST_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                line[field] = value
+        if record.exc_text:
+            line['exception'] = record.exc_text
+        return json.dumps(line)
+
+
+class RequestIdFilter(logging.Filter):
+    # Tags records logged while serving a request with its id.
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id') and has_request_context():
+            record.request_id = g.get('request_id')
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+
+    def __init__(self, log_queue):
+        super(NonBlockingQueueHandler, self).__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Resolves what can't wait (the message and traceback) and leaves
+        # formatting to the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def file_handler(config):
+    if config.get('LOG_MAX_BYTES'):
+        handler = RotatingFileHandler(config['LOG_FILE'], maxBytes=config['LOG_MAX_BYTES'],
+                                      backupCount=config.get('LOG_BACKUP_COUNT', 5))
+    else:
+        handler = TimedRotatingFileHandler(config['LOG_FILE'], when=config.get('LOG_ROTATE_WHEN', 'midnight'),
+                                           backupCount=config.get('LOG_BACKUP_COUNT', 5))
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+class StructuredLogging(object):
+
+    def __init__(self, app=None):
+        self.handler = None
+        self.listener = None
+        self.loggers = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # In debug mode records go to the console as usual, and requests are
+        # only logged by the development server.
+        app.before_request(start_request)
+        app.after_request(self.log_request)
+        if not app.debug:
+            self.start(app)
+
+    def start(self, app):
+        # Sends app.logger's records through the queue to LOG_FILE.
+        self.handler = NonBlockingQueueHandler(queue.Queue(app.config.get('LOG_QUEUE_SIZE', 10000)))
+        self.handler.addFilter(RequestIdFilter())
+        self.listener = QueueListener(self.handler.queue, file_handler(app.config), respect_handler_level=True)
+        self.listener.start()
+        app.logger.setLevel(logging.INFO)
+        # Flask's own handler writes to wsgi.errors from the request thread
+        app.logger.removeHandler(default_handler)
+        app.logger.addHandler(self.handler)
+        self.loggers.append(app.logger)
+        atexit.register(self.stop)
+
+    def stop(self):
+        # Writes out what is queued and closes the file.
+        if self.listener is None:
+            return
+        for logger in self.loggers:
+            logger.removeHandler(self.handler)
+            logger.addHandler(default_handler)
+        self.loggers = []
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
+
+    def log_request(self, response):
+        if 'request_id' not in g:
+            return response
+        response.headers['X-Request-Id'] = g.request_id
+        if self.listener is None:
+            return response
+        current_app.logger.getChild('requests').info('%s %s %s', request.method, request.path, response.status_code, extra={
+            'request_id': g.request_id,
+            'method': request.method,
+            'route': request.url_rule.rule if request.url_rule else None,
+            'path': request.path,
+            'status': response.status_code,
+            'latency_ms': round((time.perf_counter() - g.request_started) * 1000, 2),
+            'sql_statements': g.sql_statements,
+            'response_size': response.calculate_content_length()
+        })
+        return response
+
+
+def start_request():
+    g.request_id = request.headers.get('X-Request-Id') or uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+    # counted by database.count_statement
+    if 'sql_statements' not in g:
+        g.sql_statements = 0
+
+
+structured_logging = StructuredLogging()
@@ -0,0 +1,159 @@
+import bisect
+import threading
+import time
+
+from sqlalchemy import event
+
+from models import db, Venue, Artist
+
+#----------------------------------------------------------------------------#
+# Id and name lookups.
+#
+# The show form checks artist and venue ids, and the autocomplete endpoints
+# look up names, against an in-memory copy of each table's ids and names:
+# loaded with one query on first use, kept current by this process's commits
+# and reloaded every FORM_LOOKUP_MAX_AGE seconds. An id that isn't known is
+# looked up once in the database before being rejected, so rows added by
+# other processes are accepted; a row deleted elsewhere stays known until the
+# next reload, and the foreign key still catches it.
+#----------------------------------------------------------------------------#
+
+class NameIndex(object):
+    # ids and names of one model, with a sorted list of (word, id) for every
+    # word of every name and the whole lowercased name, searched by prefix
+
+    def __init__(self, model, max_age=300):
+        self.model = model
+        self.max_age = max_age
+        self.names = None
+        self.words = []
+        self.loaded = 0
+        # moved on by every change, so a load that overlaps one isn't kept
+        # as fresh
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        # (names, words), reloaded first if stale; the query runs outside
+        # the lock so other requests keep using the old copy meanwhile
+        with self.lock:
+            if self.names is not None and time.time() - self.loaded < self.max_age:
+                return self.names, self.words
+            version = self.version
+        names = dict(db.session.query(self.model.id, self.model.name))
+        words = sorted((word, model_id) for model_id, name in names.items() for word in name_words(name))
+        with self.lock:
+            self.names, self.words = names, words
+            self.loaded = time.time() if version == self.version else 0
+            return names, words
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.names = None
+            self.words = []
+
+    def exists(self, model_id):
+        names, words = self.load()
+        if model_id in names:
+            return True
+        name = db.session.query(self.model.name).filter(self.model.id == model_id).scalar()
+        if name is None:
+            return False
+        self.set(model_id, name)
+        return True
+
+    def complete(self, prefix, limit=10):
+        # [{'id': ..., 'name': ...}] of the names with a word (or the whole
+        # name) starting with `prefix`, by name
+        prefix = ' '.join(prefix.lower().split())
+        if not prefix:
+            return []
+        names, words = self.load()
+        found = set()
+        start = bisect.bisect_left(words, (prefix,))
+        for word, model_id in words[start:]:
+            if not word.startswith(prefix):
+                break
+            found.add(model_id)
+        matches = []
+        for model_id in found:
+            name = names.get(model_id)
+            # None when dropped since the words were read
+            if name is not None:
+                matches.append((name, model_id))
+        matches.sort()
+        return [{'id': model_id, 'name': name} for name, model_id in matches[:limit]]
+
+    def set(self, model_id, name):
+        with self.lock:
+            self.version += 1
+            if self.names is None:
+                return
+            self._remove(model_id)
+            self.names[model_id] = name
+            for word in name_words(name):
+                bisect.insort(self.words, (word, model_id))
+
+    def drop(self, model_id):
+        with self.lock:
+            self.version += 1
+            if self.names is not None:
+                self._remove(model_id)
+
+    def _remove(self, model_id):
+        name = self.names.pop(model_id, None)
+        if name is None:
+            return
+        for word in name_words(name):
+            index = bisect.bisect_left(self.words, (word, model_id))
+            if index < len(self.words) and self.words[index] == (word, model_id):
+                del self.words[index]
+
+
+def name_words(name):
+    name = ' '.join((name or '').lower().split())
+    return set(name.split()) | {name} if name else set()
+
+
+artist_names = NameIndex(Artist)
+venue_names = NameIndex(Venue)
+
+INDEXES = {
+    Artist: artist_names,
+    Venue: venue_names
+}
+
+
+def init_app(app):
+    for index in INDEXES.values():
+        index.max_age = app.config.get('FORM_LOOKUP_MAX_AGE', 300)
+        index.clear()
+
+#----------------------------------------------------------------------------#
+# Updates.
+#----------------------------------------------------------------------------#
+
+@event.listens_for(db.session, 'after_flush')
+def collect_name_changes(db_session, flush_context):
+    changes = db_session.info.setdefault('name_index_changes', [])
+    for instance in list(db_session.new) + list(db_session.dirty):
+        if type(instance) in INDEXES:
+            changes.append((INDEXES[type(instance)], instance.id, instance.name))
+    for instance in db_session.deleted:
+        if type(instance) in INDEXES:
+            changes.append((INDEXES[type(instance)], instance.id, None))
+
+
+@event.listens_for(db.session, 'after_commit')
+def apply_name_changes(db_session):
+    for index, model_id, name in db_session.info.pop('name_index_changes', ()):
+        if name is None:
+            index.drop(model_id)
+        else:
+            index.set(model_id, name)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_name_changes(db_session):
+    db_session.info.pop('name_index_changes', None)
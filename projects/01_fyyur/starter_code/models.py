@@ -1,9 +1,12 @@
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.dialects.postgresql import ARRAY
-from sqlalchemy import func, or_
+from sqlalchemy.dialects.postgresql import ARRAY, TSVECTOR
+from sqlalchemy import func, or_, event, DDL
 from sqlalchemy.sql import label
 
-db = SQLAlchemy()
+from routing import RoutingSQLAlchemy
+
+# Reads GET requests from the replica when one is configured (see routing.py).
+db = RoutingSQLAlchemy()
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
@@ -21,10 +24,36 @@ class Venue(db.Model):
     seeking_talent = db.Column(db.Boolean, nullable=False, default=True)
     seeking_description = db.Column(db.String(1000))
     created_date = db.Column(db.DateTime, nullable=False)
+    search_vector = db.Column(TSVECTOR)
+    # normalized "city, state", set by the database (see AREA_FUNCTIONS)
+    area_key = db.Column(db.String(250))
+    # Maintained by counters.py instead of counting shows on every page.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show',backref='venue',lazy='dynamic')
 
+    __table_args__ = (
+        db.Index('ix_Venue_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_Venue_city_state_name', 'city', 'state', 'name'),
+        db.Index('ix_Venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_Venue_area_key_name', 'area_key', 'name', 'id'),
+    )
+
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+# One row per city/state with venues in it, kept up to date by triggers on
+# Venue so the directory and area searches don't have to group venues.
+class Area(db.Model):
+    __tablename__ = 'Area'
+
+    area_key = db.Column(db.String(250), primary_key=True)
+    # as spelled by the first venue in the area
+    city = db.Column(db.String(120), nullable=False)
+    state = db.Column(db.String(120), nullable=False)
+    venue_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+
 class Artist(db.Model):
     __tablename__ = 'Artist'
 
@@ -40,10 +69,98 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=False,default=True)
     seeking_description = db.Column(db.String(1000))
     created_date = db.Column(db.DateTime, nullable=False)
+    search_vector = db.Column(TSVECTOR)
+    # Maintained by counters.py instead of counting shows on every page.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show',backref='artist',lazy='dynamic')
 
+    __table_args__ = (
+        db.Index('ix_Artist_search_vector', 'search_vector', postgresql_using='gin'),
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        db.Index('ix_Artist_genres', 'genres', postgresql_using='gin'),
+    )
+
     # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
+# search_vector is filled in by the database whenever a searchable column is
+# written, weighting name over city/state over genres. The same trigger serves
+# Venue and Artist.
+SEARCH_VECTOR_FUNCTION = DDL('''
+CREATE OR REPLACE FUNCTION search_vector_update() RETURNS trigger AS $$
+BEGIN
+  NEW.search_vector :=
+    setweight(to_tsvector('simple', coalesce(NEW.name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(NEW.city, '') || ' ' || coalesce(NEW.state, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce(array_to_string(NEW.genres, ' '), '')), 'C');
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql
+''')
+
+for model in (Venue, Artist):
+    event.listen(model.__table__, 'after_create', SEARCH_VECTOR_FUNCTION)
+    event.listen(model.__table__, 'after_create', DDL('''
+CREATE TRIGGER search_vector_update BEFORE INSERT OR UPDATE OF name, city, state, genres ON %(fullname)s
+FOR EACH ROW EXECUTE PROCEDURE search_vector_update()
+'''))
+
+# Venue.area_key is set before a venue is written, and the Area row of the
+# old and new area adjusted after, so the summary changes in the same
+# transaction as the venue or its upcoming_shows_count (whichever code path
+# updated it). counters.rebuild_areas() recomputes it from scratch.
+AREA_FUNCTIONS = DDL('''
+CREATE OR REPLACE FUNCTION area_key(city text, state text) RETURNS text AS $$
+  SELECT lower(regexp_replace(btrim(city), '\\s+', ' ', 'g')) || ', ' ||
+         lower(regexp_replace(btrim(state), '\\s+', ' ', 'g'))
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION venue_area_key() RETURNS trigger AS $$
+BEGIN
+  NEW.area_key := area_key(NEW.city, NEW.state);
+  RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION area_summary_update() RETURNS trigger AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    UPDATE "Area" SET venue_count = venue_count - 1,
+                      upcoming_shows_count = upcoming_shows_count - OLD.upcoming_shows_count
+    WHERE area_key = OLD.area_key;
+    DELETE FROM "Area" WHERE area_key = OLD.area_key AND venue_count <= 0;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    INSERT INTO "Area" (area_key, city, state, venue_count, upcoming_shows_count)
+    VALUES (NEW.area_key, NEW.city, NEW.state, 1, NEW.upcoming_shows_count)
+    ON CONFLICT (area_key) DO UPDATE
+    SET venue_count = "Area".venue_count + 1,
+        upcoming_shows_count = "Area".upcoming_shows_count + EXCLUDED.upcoming_shows_count;
+  END IF;
+  RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+''')
+
+AREA_TRIGGERS = DDL('''
+CREATE TRIGGER venue_area_key BEFORE INSERT OR UPDATE OF city, state ON "Venue"
+FOR EACH ROW EXECUTE PROCEDURE venue_area_key();
+
+CREATE TRIGGER area_summary_insert_delete AFTER INSERT OR DELETE ON "Venue"
+FOR EACH ROW EXECUTE PROCEDURE area_summary_update();
+
+CREATE TRIGGER area_summary_update AFTER UPDATE OF city, state, upcoming_shows_count ON "Venue"
+FOR EACH ROW WHEN (OLD.area_key IS DISTINCT FROM NEW.area_key
+                   OR OLD.upcoming_shows_count <> NEW.upcoming_shows_count)
+EXECUTE PROCEDURE area_summary_update()
+''')
+
+event.listen(Venue.__table__, 'after_create', AREA_FUNCTIONS)
+event.listen(Venue.__table__, 'after_create', AREA_TRIGGERS)
+
+# Minutes a show books its venue and artist for unless told otherwise.
+SHOW_DURATION = 120
+
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
 class Show(db.Model):
   __tablename__ = 'Show'
@@ -51,4 +168,34 @@ class Show(db.Model):
   id = db.Column(db.Integer, primary_key=True)
   venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'), nullable=False)
   artist_id = db.Column(db.Integer,db.ForeignKey('Artist.id'), nullable=False)
-  start_time = db.Column(db.DateTime, nullable=False)
\ No newline at end of file
+  start_time = db.Column(db.DateTime, nullable=False)
+  # Whether the show is counted in past_shows_count (rather than
+  # upcoming_shows_count) of its venue and artist.
+  counted_as_past = db.Column(db.Boolean, nullable=False, default=False, server_default='false')
+  # Minutes the venue and the artist are booked for.
+  duration = db.Column(db.Integer, nullable=False, default=SHOW_DURATION, server_default=str(SHOW_DURATION))
+
+  # Keyset pagination of /shows and of a venue's or artist's timeline walks
+  # these in order.
+  __table_args__ = (
+    db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time', 'id'),
+    db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time', 'id'),
+    db.Index('ix_Show_upcoming_start_time', 'start_time', postgresql_where=db.text('NOT counted_as_past')),
+    db.CheckConstraint('duration > 0', name='ck_Show_duration_positive'),
+  )
+
+# The time a show books its venue and artist for, as a range. Bookings of the
+# same venue or the same artist may not overlap: each exclusion constraint is
+# backed by a GiST index over (owner, booked range), so the check is an index
+# probe rather than a scan of the owner's shows. int4range(id, id, '[]') stands
+# in for equality on the owner, which plain GiST can't index without
+# btree_gist.
+BOOKED_RANGE = "tsrange(start_time, start_time + duration * interval '1 minute')"
+BOOKING_CONSTRAINT = '''
+ALTER TABLE "Show" ADD CONSTRAINT "ex_Show_{0}_booking"
+EXCLUDE USING gist (int4range({0}, {0}, '[]') WITH &&, {1} WITH &&)
+'''
+
+for owner_column in ('venue_id', 'artist_id'):
+  event.listen(Show.__table__, 'after_create', DDL(BOOKING_CONSTRAINT.format(owner_column, BOOKED_RANGE)))
\ No newline at end of file
@@ -0,0 +1,305 @@
+import itertools
+import json
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from flask import Blueprint, Response, abort, current_app, g, has_request_context, render_template, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+#----------------------------------------------------------------------------#
+# Request profiler.
+#
+# Profiles a request when PROFILE_REQUESTS is on, when it wins the
+# PROFILE_SAMPLE_RATE draw, or when it carries an X-Profile header matching
+# PROFILE_TOKEN (any X-Profile header in debug mode). A profiled request
+# records its wall time split into SQL (executing statements; rows streamed
+# afterwards with yield_per count as Python), template rendering and the
+# Python left over, and a background thread samples its stack every
+# PROFILE_INTERVAL seconds. The last PROFILE_HISTORY profiles are kept in
+# memory; /_debug/slow lists the slowest of them, and each one's samples can
+# be downloaded as collapsed stacks (flamegraph.pl, speedscope) or as a
+# speedscope file.
+#----------------------------------------------------------------------------#
+
+PROFILE_HEADER = 'X-Profile'
+
+
+class Profile(object):
+
+    def __init__(self, request_id, method, path):
+        self.id = request_id
+        self.method = method
+        self.path = path
+        self.status = None
+        self.started = time.perf_counter()
+        self.wall = 0.0
+        self.sql = 0.0
+        self.sql_statements = 0
+        self.template = 0.0
+        # written by the sampler thread while the request runs
+        self.stacks = Counter()
+        self.samples = 0
+        self.lock = threading.Lock()
+        self._rendering = 0
+        self._sql_started = None
+
+    @property
+    def python(self):
+        return max(self.wall - self.sql - self.template, 0.0)
+
+    def stack_counts(self):
+        with self.lock:
+            return dict(self.stacks), self.samples
+
+    def summary(self):
+        stacks, samples = self.stack_counts()
+        return {
+            'id': self.id,
+            'method': self.method,
+            'path': self.path,
+            'status': self.status,
+            'wall_ms': round(self.wall * 1000, 2),
+            'sql_ms': round(self.sql * 1000, 2),
+            'template_ms': round(self.template * 1000, 2),
+            'python_ms': round(self.python * 1000, 2),
+            'sql_statements': self.sql_statements,
+            'samples': samples
+        }
+
+    def collapsed(self):
+        # one "outermost;...;innermost count" line per distinct stack
+        stacks = self.stack_counts()[0]
+        return ''.join('{} {}\n'.format(';'.join(stack), count)
+                       for stack, count in sorted(stacks.items()))
+
+    def speedscope(self, interval):
+        frames = []
+        index = {}
+        samples = []
+        weights = []
+        stacks = self.stack_counts()[0]
+        for stack, count in sorted(stacks.items()):
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({'name': frame})
+            samples.append([index[frame] for frame in stack])
+            weights.append(count * interval * 1000)
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': '{} {}'.format(self.method, self.path),
+                'unit': 'milliseconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights
+            }],
+            'name': '{} {}'.format(self.method, self.path)
+        }
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '{} ({}:{})'.format(code.co_name, code.co_filename, frame.f_lineno)
+
+
+class StackSampler(object):
+    # One thread sampling the stacks of every thread serving a profiled
+    # request. It waits on `changed` while none is, instead of waking up
+    # every interval.
+
+    def __init__(self):
+        self.active = {}
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.thread = None
+        self.interval = 0.005
+
+    def add(self, thread_id, profile):
+        with self.lock:
+            self.active[thread_id] = profile
+            self.changed.notify()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+                self.thread.start()
+
+    def remove(self, thread_id):
+        with self.lock:
+            self.active.pop(thread_id, None)
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.active:
+                    self.changed.wait()
+            time.sleep(self.interval)
+            with self.lock:
+                active = list(self.active.items())
+            if not active:
+                continue
+            frames = sys._current_frames()
+            for thread_id, profile in active:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    stack.append(frame_name(frame))
+                    frame = frame.f_back
+                with profile.lock:
+                    profile.stacks[tuple(reversed(stack))] += 1
+                    profile.samples += 1
+
+
+class ProfiledTemplate(Template):
+    # Counts time spent rendering top-level templates (includes and
+    # extends render inside them) towards the current profile.
+
+    def render(self, *args, **kwargs):
+        profile = current_profile()
+        if profile is None:
+            return super(ProfiledTemplate, self).render(*args, **kwargs)
+        profile._rendering += 1
+        started = time.perf_counter()
+        sql_before = profile.sql
+        try:
+            return super(ProfiledTemplate, self).render(*args, **kwargs)
+        finally:
+            profile._rendering -= 1
+            if not profile._rendering:
+                # lazy loads run from the template count as SQL
+                profile.template += time.perf_counter() - started - (profile.sql - sql_before)
+
+
+def current_profile():
+    return g.get('profile') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    if profile is not None:
+        profile._sql_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def stop_sql_timer(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    if profile is not None and profile._sql_started is not None:
+        profile.sql += time.perf_counter() - profile._sql_started
+        profile.sql_statements += 1
+        profile._sql_started = None
+
+
+class Profiler(object):
+
+    def __init__(self, app=None):
+        self.history = deque(maxlen=200)
+        self.sampler = StackSampler()
+        self._ids = itertools.count(1)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.always = app.config.get('PROFILE_REQUESTS', False)
+        self.sample_rate = app.config.get('PROFILE_SAMPLE_RATE', 0.0)
+        self.token = app.config.get('PROFILE_TOKEN')
+        self.sampler.interval = app.config.get('PROFILE_INTERVAL', 0.005)
+        self.history = deque(maxlen=app.config.get('PROFILE_HISTORY', 200))
+        app.jinja_env.template_class = ProfiledTemplate
+        app.before_request(self.start)
+        app.after_request(self.record_status)
+        app.teardown_request(self.finish)
+        app.register_blueprint(debug_pages)
+
+    def authorized(self, supplied):
+        # whether a request carrying X-Profile: `supplied` may be profiled
+        if supplied is None:
+            return False
+        return current_app.debug or (self.token is not None and supplied == self.token)
+
+    def wanted(self):
+        if request.blueprint == debug_pages.name:
+            return False
+        return (self.always or random.random() < self.sample_rate
+                or self.authorized(request.headers.get(PROFILE_HEADER)))
+
+    def start(self):
+        if not self.wanted():
+            return
+        g.profile = Profile(next(self._ids), request.method, request.full_path.rstrip('?'))
+        self.sampler.add(threading.get_ident(), g.profile)
+
+    def record_status(self, response):
+        profile = current_profile()
+        if profile is not None:
+            profile.status = response.status_code
+            response.headers['X-Profile-Id'] = str(profile.id)
+        return response
+
+    def finish(self, error=None):
+        # teardown runs after a streamed body has been sent, so its time
+        # is included
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        self.sampler.remove(threading.get_ident())
+        profile.wall = time.perf_counter() - profile.started
+        self.history.append(profile)
+
+    def slowest(self, count):
+        return sorted(self.history, key=lambda profile: profile.wall, reverse=True)[:count]
+
+    def get(self, profile_id):
+        for profile in self.history:
+            if profile.id == profile_id:
+                return profile
+        return None
+
+
+profiler = Profiler()
+
+debug_pages = Blueprint('debug_pages', __name__, url_prefix='/_debug')
+
+
+@debug_pages.before_request
+def require_authorization():
+    # open in debug mode, otherwise for an X-Profile header matching
+    # PROFILE_TOKEN (never a query parameter, which would end up in logs)
+    if not (current_app.debug or profiler.authorized(request.headers.get(PROFILE_HEADER))):
+        abort(404)
+
+
+@debug_pages.route('/slow')
+def slow_requests():
+    profiles = profiler.slowest(current_app.config.get('PROFILE_SLOW_REQUESTS', 50))
+    if request.args.get('format') == 'json':
+        return Response(json.dumps([profile.summary() for profile in profiles]), mimetype='application/json')
+    return render_template('pages/slow_requests.html', profiles=[profile.summary() for profile in profiles])
+
+
+def profile_or_404(profile_id):
+    profile = profiler.get(profile_id)
+    if profile is None:
+        abort(404)
+    return profile
+
+
+@debug_pages.route('/profiles/<int:profile_id>.collapsed')
+def collapsed_stacks(profile_id):
+    profile = profile_or_404(profile_id)
+    return Response(profile.collapsed(), mimetype='text/plain', headers={
+        'Content-Disposition': 'attachment; filename=profile-{}.collapsed'.format(profile_id)})
+
+
+@debug_pages.route('/profiles/<int:profile_id>.speedscope.json')
+def speedscope(profile_id):
+    profile = profile_or_404(profile_id)
+    return Response(json.dumps(profile.speedscope(profiler.sampler.interval)), mimetype='application/json', headers={
+        'Content-Disposition': 'attachment; filename=profile-{}.speedscope.json'.format(profile_id)})
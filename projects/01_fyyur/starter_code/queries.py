@@ -0,0 +1,548 @@
+import base64
+import json
+import re
+from datetime import datetime, timedelta
+from itertools import groupby
+
+from sqlalchemy import case, literal_column, true, tuple_
+
+from models import db, Venue, Artist, Show, Area, func, or_, BOOKED_RANGE
+
+#----------------------------------------------------------------------------#
+# Venue directory.
+#----------------------------------------------------------------------------#
+
+STREAM_BATCH_SIZE = 1000
+
+
+def iter_venue_directory():
+    # Builds the area -> venues -> num_upcoming_shows tree for /venues from a
+    # single statement, reading the Area summary and the maintained show
+    # counters. Rows come back in ix_Venue_area_key_name order so each area's
+    # venues are adjacent and can be grouped without another round trip.
+    # Areas are yielded as they complete while rows stream from the database.
+    rows = db.session.query(
+        Area.area_key,
+        Area.city,
+        Area.state,
+        Area.venue_count,
+        Area.upcoming_shows_count,
+        Venue.id,
+        Venue.name,
+        Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).join(Venue, Venue.area_key == Area.area_key).order_by(
+        Venue.area_key, Venue.name, Venue.id
+    ).yield_per(STREAM_BATCH_SIZE)
+
+    for _, venues in groupby(rows, key=lambda row: row.area_key):
+        venues = list(venues)
+        yield {
+            'city': venues[0].city,
+            'state': venues[0].state,
+            'num_venues': venues[0].venue_count,
+            'num_upcoming_shows': venues[0].upcoming_shows_count,
+            'venues': [{
+                'id': venue.id,
+                'name': venue.name,
+                'num_upcoming_shows': venue.num_upcoming_shows
+            } for venue in venues]
+        }
+
+
+def venue_directory():
+    return list(iter_venue_directory())
+
+#----------------------------------------------------------------------------#
+# Show timelines.
+#----------------------------------------------------------------------------#
+
+PAST_SHOWS_PER_PAGE = 12
+
+
+def encode_cursor(values):
+    # Opaque "load more" token for a keyset position.
+    raw = json.dumps(values, default=lambda value: value.isoformat())
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+
+def _timeline_key(cursor):
+    # Past shows are walked newest first on (start_time, id).
+    try:
+        start_time, show_id = decode_cursor(cursor)
+        return datetime.fromisoformat(start_time), int(show_id)
+    except (TypeError, ValueError):
+        raise ValueError('Invalid cursor: {}'.format(cursor))
+
+
+def _timeline_columns(owner):
+    # The shows of a venue list the artists playing there and vice versa.
+    if owner == 'venue':
+        return Show.venue_id, Artist, Show.artist_id, 'artist'
+    return Show.artist_id, Venue, Show.venue_id, 'venue'
+
+
+def _show_entry(row, other):
+    return {
+        other + '_id': row.other_id,
+        other + '_name': row.other_name,
+        other + '_image_link': row.other_image_link,
+        'start_time': str(row.start_time)
+    }
+
+
+def show_timeline(owner, owner_id, limit=PAST_SHOWS_PER_PAGE):
+    # Upcoming shows, the first page of past shows and both totals for a venue
+    # or artist detail page, from one statement. The window counts cover every
+    # show of the owner, so the totals don't depend on how many past shows are
+    # returned.
+    owner_column, other_model, other_column, other = _timeline_columns(owner)
+    is_upcoming = (Show.start_time > func.now()).label('is_upcoming')
+
+    shows = db.session.query(
+        Show.id,
+        Show.start_time,
+        other_model.id.label('other_id'),
+        other_model.name.label('other_name'),
+        other_model.image_link.label('other_image_link'),
+        is_upcoming,
+        func.row_number().over(
+            partition_by=is_upcoming,
+            order_by=(Show.start_time.desc(), Show.id.desc())
+        ).label('position'),
+        func.count(Show.id).filter(Show.start_time > func.now()).over().label('upcoming_count'),
+        func.count(Show.id).filter(Show.start_time <= func.now()).over().label('past_count')
+    ).join(other_model, other_model.id == other_column).filter(
+        owner_column == owner_id
+    ).subquery()
+
+    rows = db.session.query(shows).filter(
+        or_(shows.c.is_upcoming, shows.c.position <= limit)
+    ).order_by(
+        shows.c.is_upcoming.desc(),
+        case((shows.c.is_upcoming, shows.c.start_time)).asc(),
+        shows.c.start_time.desc(),
+        shows.c.id.desc()
+    ).all()
+
+    timeline = {
+        'upcoming_shows': [],
+        'past_shows': [],
+        'upcoming_shows_count': 0,
+        'past_shows_count': 0,
+        'next_cursor': None
+    }
+    last = None
+    for row in rows:
+        if row.is_upcoming:
+            timeline['upcoming_shows'].append(_show_entry(row, other))
+        else:
+            timeline['past_shows'].append(_show_entry(row, other))
+            last = row
+        timeline['upcoming_shows_count'] = row.upcoming_count
+        timeline['past_shows_count'] = row.past_count
+
+    if last is not None and last.position < last.past_count:
+        timeline['next_cursor'] = encode_cursor([last.start_time, last.id])
+    return timeline
+
+
+def past_shows_page(owner, owner_id, cursor, limit=PAST_SHOWS_PER_PAGE):
+    # The next page of past shows after `cursor`, seeking on the
+    # (owner, start_time, id) index instead of counting skipped rows.
+    owner_column, other_model, other_column, other = _timeline_columns(owner)
+    start_time, show_id = _timeline_key(cursor)
+
+    rows = db.session.query(
+        Show.id,
+        Show.start_time,
+        other_model.id.label('other_id'),
+        other_model.name.label('other_name'),
+        other_model.image_link.label('other_image_link')
+    ).join(other_model, other_model.id == other_column).filter(
+        owner_column == owner_id,
+        Show.start_time <= func.now(),
+        tuple_(Show.start_time, Show.id) < tuple_(start_time, show_id)
+    ).order_by(Show.start_time.desc(), Show.id.desc()).limit(limit + 1).all()
+
+    page = {
+        'past_shows': [_show_entry(row, other) for row in rows[:limit]],
+        'next_cursor': None
+    }
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        page['next_cursor'] = encode_cursor([last.start_time, last.id])
+    return page
+
+
+def venue_details(venue_id):
+    # Everything the venue page shows, or None for an unknown venue.
+    venue_info = Venue.query.get(venue_id)
+    if not venue_info:
+        return None
+    timeline = show_timeline('venue', venue_id)
+
+    return {
+        "id": venue_info.id,
+        "name": venue_info.name,
+        "city": venue_info.city,
+        "state": venue_info.state,
+        "address": venue_info.address,
+        "phone": venue_info.phone,
+        "genres": venue_info.genres,
+        "image_link": venue_info.image_link,
+        "facebook_link": venue_info.facebook_link,
+        "website": venue_info.website,
+        "seeking_talent": venue_info.seeking_talent,
+        "seeking_description": venue_info.seeking_description,
+        "upcoming_shows_count": timeline['upcoming_shows_count'],
+        "past_shows_count": timeline['past_shows_count'],
+        "upcoming_shows": timeline['upcoming_shows'],
+        "past_shows": timeline['past_shows'],
+        "past_shows_cursor": timeline['next_cursor']
+    }
+
+
+def artist_details(artist_id):
+    # Everything the artist page shows, or None for an unknown artist.
+    artist_info = Artist.query.get(artist_id)
+    if not artist_info:
+        return None
+    timeline = show_timeline('artist', artist_id)
+
+    return {
+        "id": artist_info.id,
+        "name": artist_info.name,
+        "genres": artist_info.genres,
+        "city": artist_info.city,
+        "state": artist_info.state,
+        "phone": artist_info.phone,
+        "website": artist_info.website,
+        "facebook_link": artist_info.facebook_link,
+        "seeking_venue": artist_info.seeking_venue,
+        "seeking_description": artist_info.seeking_description,
+        "image_link": artist_info.image_link,
+        "past_shows": timeline['past_shows'],
+        "upcoming_shows": timeline['upcoming_shows'],
+        "past_shows_count": timeline['past_shows_count'],
+        "upcoming_shows_count": timeline['upcoming_shows_count'],
+        "past_shows_cursor": timeline['next_cursor']
+    }
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+SEARCH_RESULTS_PER_PAGE = 20
+
+
+def search_query(search_term):
+    # Every word of the term has to prefix-match a word of the name,
+    # city/state or genres, so "musical h" and "San Francisco, CA" both match.
+    words = re.findall(r'\w+', search_term.lower())
+    if not words:
+        return None
+    return func.to_tsquery('simple', ' & '.join(word + ':*' for word in words))
+
+
+def search_area(search_term):
+    # The Area a "City, State" term names exactly, looked up by its key as
+    # the area_key() SQL function the Venue trigger uses computes it.
+    city, comma, state = search_term.rpartition(',')
+    if not comma or not city.strip() or not state.strip():
+        return None
+    return Area.query.filter(Area.area_key == func.area_key(city, state)).first()
+
+
+def search(model, search_term, page=1, per_page=SEARCH_RESULTS_PER_PAGE):
+    # Ranked venue or artist search backed by the GIN index on search_vector.
+    # A venue search for an area ("San Francisco, CA") lists that area's
+    # venues instead, counted by the Area summary.
+    results = {
+        'count': 0,
+        'data': [],
+        'page': page,
+        'has_next': False
+    }
+    area = search_area(search_term) if model is Venue else None
+    if area is not None:
+        rows = db.session.query(Venue.id, Venue.name).filter(
+            Venue.area_key == area.area_key
+        ).order_by(Venue.name, Venue.id).offset((page - 1) * per_page).limit(per_page).all()
+        results['count'] = area.venue_count
+        results['data'] = [{'id': row.id, 'name': row.name} for row in rows]
+        results['has_next'] = page * per_page < results['count']
+        return results
+
+    query = search_query(search_term)
+    if query is None:
+        return results
+
+    matches = model.search_vector.op('@@')(query)
+    rows = db.session.query(
+        model.id,
+        model.name,
+        func.count(model.id).over().label('total')
+    ).filter(matches).order_by(
+        func.ts_rank(model.search_vector, query).desc(),
+        model.name,
+        model.id
+    ).offset((page - 1) * per_page).limit(per_page).all()
+
+    if rows:
+        results['count'] = rows[0].total
+    elif page > 1:
+        results['count'] = db.session.query(func.count(model.id)).filter(matches).scalar()
+    results['data'] = [{'id': row.id, 'name': row.name} for row in rows]
+    results['has_next'] = page * per_page < results['count']
+    return results
+
+#----------------------------------------------------------------------------#
+# Listings.
+#
+# /artists and /shows are paged by keyset: a cursor holds the sort key of the
+# first or last row shown, and the next page seeks past it on an index, so a
+# deep page costs the same as the first one.
+#----------------------------------------------------------------------------#
+
+ARTISTS_PER_PAGE = 20
+SHOWS_PER_PAGE = 24
+
+
+def _listing_page(query, columns, cursor, parse_key, entry, per_page):
+    direction, key = 'next', None
+    if cursor:
+        try:
+            direction, *values = decode_cursor(cursor)
+            key = parse_key(values)
+        except (TypeError, ValueError):
+            raise ValueError('Invalid cursor: {}'.format(cursor))
+        if direction not in ('next', 'prev'):
+            raise ValueError('Invalid cursor: {}'.format(cursor))
+
+    if key is not None:
+        position = tuple_(*columns)
+        query = query.filter(position > tuple_(*key) if direction == 'next' else position < tuple_(*key))
+    if direction == 'next':
+        query = query.order_by(*columns)
+    else:
+        query = query.order_by(*(column.desc() for column in columns))
+    rows = query.limit(per_page + 1).all()
+
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if direction == 'prev':
+        rows.reverse()
+    # a page reached through a cursor always has something on the side it
+    # came from
+    has_next = more if direction == 'next' else True
+    has_prev = more if direction == 'prev' else key is not None
+
+    page = {
+        'data': [entry(row) for row in rows],
+        'next_cursor': None,
+        'prev_cursor': None
+    }
+    if rows and has_next:
+        page['next_cursor'] = encode_cursor(['next'] + [getattr(rows[-1], column.key) for column in columns])
+    if rows and has_prev:
+        page['prev_cursor'] = encode_cursor(['prev'] + [getattr(rows[0], column.key) for column in columns])
+    return page
+
+
+def _artists_query():
+    return db.session.query(Artist.id, Artist.name)
+
+
+def _artist_entry(row):
+    return {'id': row.id, 'name': row.name}
+
+
+def _shows_query():
+    return db.session.query(
+        Show.id,
+        Show.start_time,
+        Show.venue_id,
+        Venue.name.label('venue_name'),
+        Show.artist_id,
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link')
+    ).join(Venue, Venue.id == Show.venue_id).join(Artist, Artist.id == Show.artist_id)
+
+
+def _show_listing_entry(row):
+    return {
+        'venue_id': row.venue_id,
+        'venue_name': row.venue_name,
+        'artist_id': row.artist_id,
+        'artist_name': row.artist_name,
+        'artist_image_link': row.artist_image_link,
+        'start_time': str(row.start_time)
+    }
+
+
+def artists_page(cursor=None, per_page=ARTISTS_PER_PAGE):
+    # Artists ordered by (name, id).
+    def parse_key(values):
+        name, artist_id = values
+        return str(name), int(artist_id)
+
+    return _listing_page(_artists_query(), (Artist.name, Artist.id), cursor, parse_key, _artist_entry, per_page)
+
+
+def shows_page(cursor=None, per_page=SHOWS_PER_PAGE):
+    # Shows ordered by (start_time, id), with their venue and artist.
+    def parse_key(values):
+        start_time, show_id = values
+        return datetime.fromisoformat(start_time), int(show_id)
+
+    return _listing_page(_shows_query(), (Show.start_time, Show.id), cursor, parse_key, _show_listing_entry, per_page)
+
+
+def iter_artists():
+    # The whole listing in page order, streamed from the database.
+    for row in _artists_query().order_by(Artist.name, Artist.id).yield_per(STREAM_BATCH_SIZE):
+        yield _artist_entry(row)
+
+
+def iter_shows():
+    for row in _shows_query().order_by(Show.start_time, Show.id).yield_per(STREAM_BATCH_SIZE):
+        yield _show_listing_entry(row)
+
+#----------------------------------------------------------------------------#
+# Genre browse.
+#
+# "Jazz venues in San Francisco": venues or artists filtered by genre
+# (containment for every genre, overlap for any of them, both served by the
+# GIN index on genres) and optionally by area, with facet counts per genre and
+# per city/state over the filtered set.
+#----------------------------------------------------------------------------#
+
+BROWSE_RESULTS_PER_PAGE = 20
+
+
+def _browse_filters(model, genres, match, city, state):
+    if match not in ('all', 'any'):
+        raise ValueError('Unknown genre match: {}'.format(match))
+    filters = []
+    if genres and match == 'any':
+        filters.append(model.genres.overlap(genres))
+    elif genres:
+        filters.append(model.genres.contains(genres))
+    if city:
+        filters.append(model.city == city)
+    if state:
+        filters.append(model.state == state)
+    return filters
+
+
+def browse_facets(model, genres=(), match='all', city=None, state=None):
+    # Both facets from one statement: the filtered rows are joined to their
+    # unnested genres and counted under two grouping sets, (genre) and
+    # (city, state). count(DISTINCT id) keeps a venue with three genres from
+    # counting three times in its area.
+    matches = db.session.query(model.id, model.city, model.state, model.genres).filter(
+        *_browse_filters(model, genres, match, city, state)
+    ).subquery()
+    genre = func.unnest(matches.c.genres).table_valued('genre').lateral('genre')
+
+    rows = db.session.query(
+        genre.c.genre,
+        matches.c.city,
+        matches.c.state,
+        func.count(func.distinct(matches.c.id)).label('count'),
+        func.grouping(genre.c.genre).label('by_area')
+    ).select_from(matches).outerjoin(genre, true()).group_by(
+        func.grouping_sets(tuple_(genre.c.genre), tuple_(matches.c.city, matches.c.state))
+    ).all()
+
+    facets = {'genres': [], 'areas': []}
+    for row in rows:
+        if row.by_area:
+            facets['areas'].append({'city': row.city, 'state': row.state, 'count': row.count})
+        elif row.genre is not None:
+            facets['genres'].append({'genre': row.genre, 'count': row.count})
+    facets['genres'].sort(key=lambda facet: (-facet['count'], facet['genre']))
+    facets['areas'].sort(key=lambda facet: (-facet['count'], facet['city'], facet['state']))
+    return facets
+
+
+def browse(model, genres=(), match='all', city=None, state=None, page=1, per_page=BROWSE_RESULTS_PER_PAGE):
+    genres = list(genres)
+    facets = browse_facets(model, genres, match, city, state)
+    rows = db.session.query(model.id, model.name, model.city, model.state, model.genres).filter(
+        *_browse_filters(model, genres, match, city, state)
+    ).order_by(model.name, model.id).offset((page - 1) * per_page).limit(per_page).all()
+
+    # every match is in exactly one area
+    count = sum(area['count'] for area in facets['areas'])
+    return {
+        'count': count,
+        'data': [{
+            'id': row.id,
+            'name': row.name,
+            'city': row.city,
+            'state': row.state,
+            'genres': row.genres
+        } for row in rows],
+        'facets': facets,
+        'page': page,
+        'has_next': page * per_page < count
+    }
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+# Longest window available_slots() will look at.
+MAX_SLOT_WINDOW = timedelta(days=31)
+
+
+def _booked_by(owner_column, owner_id):
+    # Written exactly like the exclusion constraint's index expression, so the
+    # lookup is served by that GiST index.
+    return literal_column("int4range({0}, {0}, '[]')".format(owner_column)).op('&&')(
+        func.int4range(owner_id, owner_id, literal_column("'[]'")))
+
+
+def available_slots(start, end, duration, venue_id=None, artist_id=None):
+    # Free stretches of at least `duration` minutes between start and end in
+    # which neither the venue nor the artist is booked. Only the shows
+    # overlapping the window are read.
+    if end <= start or end - start > MAX_SLOT_WINDOW:
+        raise ValueError('Invalid window: {} to {}'.format(start, end))
+    if duration <= 0:
+        raise ValueError('Invalid duration: {}'.format(duration))
+    if venue_id is None and artist_id is None:
+        raise ValueError('A venue or an artist is needed')
+    owners = []
+    if venue_id is not None:
+        owners.append(_booked_by('venue_id', venue_id))
+    if artist_id is not None:
+        owners.append(_booked_by('artist_id', artist_id))
+
+    booked = literal_column(BOOKED_RANGE)
+    rows = db.session.query(
+        Show.start_time,
+        func.upper(booked).label('end_time')
+    ).filter(
+        or_(*owners),
+        booked.op('&&')(func.tsrange(start, end))
+    ).order_by(Show.start_time).all()
+
+    length = timedelta(minutes=duration)
+    slots = []
+    free_from = start
+    for row in rows:
+        if row.start_time - free_from >= length:
+            slots.append({'start': str(free_from), 'end': str(row.start_time)})
+        free_from = max(free_from, row.end_time)
+    if end - free_from >= length:
+        slots.append({'start': str(free_from), 'end': str(end)})
+    return slots
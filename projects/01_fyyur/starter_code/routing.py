@@ -0,0 +1,84 @@
+import time
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+#----------------------------------------------------------------------------#
+# Read replica routing.
+#
+# With a 'replica' bind in SQLALCHEMY_BINDS, GET and HEAD requests read from
+# the replica and everything else uses the primary. A request that writes
+# stays on the primary from its first write on, and its client is pinned to
+# the primary for READ_YOUR_WRITES_SECONDS afterwards (through a cookie), so
+# it sees its own changes while the replica catches up: its requests also
+# skip the page cache and ETags (see cache.py). Outside of requests (CLI
+# commands, tests) the primary is always used.
+#----------------------------------------------------------------------------#
+
+REPLICA_BIND = 'replica'
+PRIMARY_COOKIE = 'primary_until'
+
+
+class RoutingSession(SignallingSession):
+
+    def __init__(self, db, **options):
+        self.db = db
+        super(RoutingSession, self).__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self._flushing or isinstance(clause, UpdateBase):
+            # from here on the transaction reads what it wrote
+            self.info['wrote'] = True
+            if has_request_context():
+                g.db_wrote = True
+        elif not self.info.get('wrote') and use_replica():
+            return self.db.get_engine(self.app, bind=REPLICA_BIND)
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+@event.listens_for(RoutingSession, 'after_rollback')
+def end_of_transaction(session):
+    session.info.pop('wrote', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+def replica_configured(app):
+    return REPLICA_BIND in (app.config.get('SQLALCHEMY_BINDS') or {})
+
+
+def use_replica():
+    return has_request_context() and g.get('db_use_replica', False)
+
+
+def pinned_to_primary():
+    # The client wrote within READ_YOUR_WRITES_SECONDS, so cached pages and
+    # validators (possibly built from the replica) mustn't answer it either.
+    return (has_request_context()
+            and replica_configured(current_app)
+            and request.cookies.get(PRIMARY_COOKIE, 0, type=float) >= time.time())
+
+
+def choose_database():
+    g.db_use_replica = (replica_configured(current_app)
+                        and request.method in ('GET', 'HEAD')
+                        and not pinned_to_primary())
+
+
+def pin_to_primary(response):
+    if g.get('db_wrote'):
+        window = current_app.config['READ_YOUR_WRITES_SECONDS']
+        response.set_cookie(PRIMARY_COOKIE, str(time.time() + window), max_age=window, httponly=True)
+    return response
+
+
+def init_app(app):
+    app.before_request(choose_database)
+    app.after_request(pin_to_primary)
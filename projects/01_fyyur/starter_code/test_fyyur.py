@@ -0,0 +1,1023 @@
+import io
+import json
+import os
+import queue
+import re
+import tempfile
+import threading
+import time
+import unittest
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from sqlalchemy import event
+
+from app import app
+from models import db, Venue, Artist, Show, Area
+from queries import (
+    venue_directory, show_timeline, past_shows_page, search, search_area, artists_page, shows_page, browse,
+    available_slots
+)
+from counters import rollover_shows, reconcile_show_counts, rebuild_areas
+from cache import page_cache, LRUBackend, FileBackend
+from importer import import_shows
+from formatting import format_datetime
+from writebehind import write_behind
+from profiling import Profile, StackSampler, profiler
+from logs import NonBlockingQueueHandler, structured_logging
+from forms import ShowForm
+from lookups import artist_names, venue_names
+
+# Statements the /venues directory may issue, however many areas are listed.
+VENUES_QUERY_BUDGET = 1
+# Statements a venue page may issue: the venue itself plus its show timeline.
+SHOW_VENUE_QUERY_BUDGET = 2
+
+
+@contextmanager
+def count_queries():
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur test case"""
+
+    def setUp(self):
+        """Define test variables and initialize app."""
+        self.database_name = "fyyur_test"
+        self.database_path = os.environ.get(
+            'TEST_DATABASE_URL',
+            "postgresql://{}:{}@{}/{}".format('student', 'student', 'localhost:5432', self.database_name))
+        app.config['SQLALCHEMY_DATABASE_URI'] = self.database_path
+        app.config['WTF_CSRF_ENABLED'] = False
+        self.client = app.test_client
+
+        self.ctx = app.app_context()
+        self.ctx.push()
+        db.create_all()
+        page_cache.clear()
+        artist_names.clear()
+        venue_names.clear()
+
+    def tearDown(self):
+        """Executed after each test"""
+        db.session.remove()
+        db.drop_all()
+        self.ctx.pop()
+
+    def add_venue(self, name, city='San Francisco', state='CA', genres=('Jazz',)):
+        venue = Venue(name=name, city=city, state=state, genres=list(genres), created_date=datetime.now())
+        db.session.add(venue)
+        db.session.commit()
+        return venue.id
+
+    def add_artist(self, name, city='San Francisco', state='CA'):
+        artist = Artist(name=name, city=city, state=state, genres=['Jazz'], created_date=datetime.now())
+        db.session.add(artist)
+        db.session.commit()
+        return artist.id
+
+    def add_show(self, venue_id, artist_id, start_time):
+        show = Show(venue_id=venue_id, artist_id=artist_id, start_time=start_time)
+        db.session.add(show)
+        db.session.commit()
+        return show.id
+
+    def test_venues_directory_query_budget(self):
+        artist_id = self.add_artist('The Wild Sax Band')
+        for n, (city, state) in enumerate([('San Francisco', 'CA'), ('New York', 'NY'), ('Austin', 'TX')]):
+            for i in range(3):
+                venue_id = self.add_venue('{} Hall {}'.format(city, i), city, state)
+                self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=1 + 3 * n + i))
+        db.session.remove()
+
+        with count_queries() as statements:
+            res = self.client().get('/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(len(statements), VENUES_QUERY_BUDGET)
+
+    def test_venues_directory_counts_upcoming_shows_only(self):
+        artist_id = self.add_artist('Guns N Petals')
+        venue_id = self.add_venue('The Musical Hop')
+        self.add_venue('Park Square Live Music & Coffee', 'New York', 'NY')
+        self.add_show(venue_id, artist_id, datetime.now() - timedelta(days=30))
+        self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=30))
+        self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=60))
+
+        areas = {(area['city'], area['state']): area['venues'] for area in venue_directory()}
+
+        self.assertEqual(len(areas), 2)
+        self.assertEqual(areas[('San Francisco', 'CA')][0]['num_upcoming_shows'], 2)
+        self.assertEqual(areas[('New York', 'NY')][0]['num_upcoming_shows'], 0)
+
+    def test_show_timeline_splits_past_and_upcoming(self):
+        artist_id = self.add_artist('Matt Quevedo')
+        venue_id = self.add_venue('The Dueling Pianos Bar')
+        now = datetime.now()
+        for days in (-3, -2, -1, 1, 2):
+            self.add_show(venue_id, artist_id, now + timedelta(days=days))
+
+        timeline = show_timeline('venue', venue_id, limit=2)
+
+        self.assertEqual(timeline['upcoming_shows_count'], 2)
+        self.assertEqual(timeline['past_shows_count'], 3)
+        self.assertEqual(len(timeline['upcoming_shows']), 2)
+        self.assertEqual(len(timeline['past_shows']), 2)
+        self.assertLess(timeline['upcoming_shows'][0]['start_time'], timeline['upcoming_shows'][1]['start_time'])
+        self.assertGreater(timeline['past_shows'][0]['start_time'], timeline['past_shows'][1]['start_time'])
+        self.assertEqual(timeline['past_shows'][0]['artist_name'], 'Matt Quevedo')
+        self.assertTrue(timeline['next_cursor'])
+
+        page = past_shows_page('venue', venue_id, timeline['next_cursor'], limit=2)
+        self.assertEqual(len(page['past_shows']), 1)
+        self.assertLess(page['past_shows'][0]['start_time'], timeline['past_shows'][1]['start_time'])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_show_venue_query_budget(self):
+        artist_id = self.add_artist('The Wild Sax Band')
+        venue_id = self.add_venue('The Musical Hop')
+        for days in range(-20, 20):
+            self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=days, hours=1))
+        db.session.remove()
+
+        with count_queries() as statements:
+            res = self.client().get('/venues/{}'.format(venue_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertLessEqual(len(statements), SHOW_VENUE_QUERY_BUDGET)
+
+    def test_artist_past_shows_load_more(self):
+        artist_id = self.add_artist('Guns N Petals')
+        venue_id = self.add_venue('Park Square Live Music & Coffee')
+        for days in range(1, 31):
+            self.add_show(venue_id, artist_id, datetime.now() - timedelta(days=days))
+
+        timeline = show_timeline('artist', artist_id)
+        seen = len(timeline['past_shows'])
+        cursor = timeline['next_cursor']
+        while cursor:
+            res = self.client().get('/artists/{}/past_shows?cursor={}'.format(artist_id, cursor))
+            page = res.get_json()
+            self.assertEqual(res.status_code, 200)
+            seen += len(page['past_shows'])
+            cursor = page['next_cursor']
+
+        self.assertEqual(seen, 30)
+
+    def test_400_past_shows_bad_cursor(self):
+        res = self.client().get('/artists/1/past_shows?cursor=not-a-cursor')
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_search_venues_ranks_name_matches_first(self):
+        self.add_venue('Jazz Corner', 'New York', 'NY')
+        self.add_venue('The Musical Hop')
+        db.session.add(Venue(name='Jazz Street Club', city='Jazzville', state='TN', genres=['Blues'], created_date=datetime.now()))
+        db.session.commit()
+
+        results = search(Venue, 'jazz')
+
+        self.assertEqual(results['count'], 3)
+        self.assertEqual(results['data'][-1]['name'], 'The Musical Hop')
+
+    def test_search_venues_by_city_and_state(self):
+        self.add_venue('The Musical Hop')
+        self.add_venue('The Dueling Pianos Bar', 'New York', 'NY')
+
+        res = self.client().post('/venues/search', data={'search_term': 'San Francisco, CA'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertNotIn(b'The Dueling Pianos Bar', res.data)
+
+    def test_search_venues_by_exact_area(self):
+        self.add_venue('The Musical Hop')
+        self.add_venue('Park Square Live Music & Coffee', 'san  francisco ', 'ca')
+        self.add_venue('San Francisco Hall', 'Oakland', 'CA')
+
+        with count_queries() as statements:
+            results = search(Venue, 'San Francisco, CA', per_page=1)
+
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(results['count'], 2)
+        self.assertEqual(results['data'], [{'id': results['data'][0]['id'], 'name': 'Park Square Live Music & Coffee'}])
+        self.assertTrue(results['has_next'])
+        # keyed exactly as the trigger keys the venue, tab and all
+        self.add_venue('The Dueling Pianos Bar', '\tNew York', 'NY')
+        self.assertEqual(search_area('\tNew York, NY').venue_count, 1)
+
+    def test_area_summary_follows_venues_and_shows(self):
+        artist_id = self.add_artist('Guns N Petals')
+        venue_id = self.add_venue('The Musical Hop')
+        self.add_venue('Park Square Live Music & Coffee', 'San Francisco ', 'ca')
+        self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=1))
+        self.add_show(venue_id, artist_id, datetime.now() - timedelta(days=1))
+
+        area = Area.query.get('san francisco, ca')
+        self.assertEqual((area.venue_count, area.upcoming_shows_count), (2, 1))
+        self.assertEqual(venue_directory()[0]['num_venues'], 2)
+
+        venue = Venue.query.get(venue_id)
+        venue.city, venue.state = 'New York', 'NY'
+        db.session.commit()
+        db.session.expire_all()
+
+        self.assertEqual(Area.query.get('san francisco, ca').venue_count, 1)
+        self.assertEqual(Area.query.get('san francisco, ca').upcoming_shows_count, 0)
+        self.assertEqual(Area.query.get('new york, ny').upcoming_shows_count, 1)
+
+        Show.query.delete()
+        Venue.query.filter_by(id=venue_id).delete()
+        db.session.commit()
+        self.assertIsNone(Area.query.get('new york, ny'))
+
+    def test_rebuild_areas_matches_triggers(self):
+        artist_id = self.add_artist('Guns N Petals')
+        for i, (city, state) in enumerate([('San Francisco', 'CA'), ('New York', 'NY'), ('New York', 'NY')]):
+            venue_id = self.add_venue('Hall {}'.format(i), city, state)
+            self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=1 + i))
+        summary = lambda: sorted((a.area_key, a.venue_count, a.upcoming_shows_count) for a in Area.query)
+        expected = summary()
+        db.session.execute(Area.__table__.delete())
+        db.session.commit()
+
+        rebuild_areas()
+        db.session.commit()
+
+        self.assertEqual(summary(), expected)
+        self.assertEqual(expected, [('new york, ny', 2, 2), ('san francisco, ca', 1, 1)])
+
+    def test_search_artists_paginates(self):
+        for i in range(5):
+            self.add_artist('Guns N Petals {}'.format(i))
+
+        first = search(Artist, 'petals', page=1, per_page=2)
+        last = search(Artist, 'petals', page=3, per_page=2)
+
+        self.assertEqual(first['count'], 5)
+        self.assertTrue(first['has_next'])
+        self.assertEqual(len(last['data']), 1)
+        self.assertFalse(last['has_next'])
+
+        res = self.client().get('/artists/search?search_term=petals&page=2')
+        self.assertEqual(res.status_code, 200)
+
+    def test_show_counters_follow_inserts(self):
+        artist_id = self.add_artist('Matt Quevedo')
+        venue_id = self.add_venue('The Dueling Pianos Bar')
+        self.add_show(venue_id, artist_id, datetime.now() - timedelta(days=1))
+        self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=1))
+
+        res = self.client().post('/shows/create', data={
+            'artist_id': artist_id,
+            'venue_id': venue_id,
+            'start_time': (datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d %H:%M:%S')
+        })
+        self.assertEqual(res.status_code, 200)
+
+        venue = Venue.query.get(venue_id)
+        artist = Artist.query.get(artist_id)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (2, 1))
+        self.assertEqual((artist.upcoming_shows_count, artist.past_shows_count), (2, 1))
+
+    def test_rollover_moves_started_shows_to_past(self):
+        artist_id = self.add_artist('Matt Quevedo')
+        venue_id = self.add_venue('The Dueling Pianos Bar')
+        show_id = self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=1))
+        self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=2))
+        # time passes for the first show
+        db.session.execute(
+            Show.__table__.update().where(Show.id == show_id).values(start_time=datetime.now() - timedelta(hours=1)))
+        db.session.commit()
+
+        self.assertEqual(rollover_shows(), 1)
+        self.assertEqual(rollover_shows(), 0)
+
+        venue = Venue.query.get(venue_id)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 1))
+        self.assertEqual(venue_directory()[0]['venues'][0]['num_upcoming_shows'], 1)
+
+    def test_reconcile_rebuilds_show_counters(self):
+        artist_id = self.add_artist('Matt Quevedo')
+        venue_id = self.add_venue('The Dueling Pianos Bar')
+        self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=1))
+        self.add_show(venue_id, artist_id, datetime.now() - timedelta(days=1))
+        db.session.execute(Venue.__table__.update().values(upcoming_shows_count=42, past_shows_count=7))
+        db.session.commit()
+
+        result = app.test_cli_runner().invoke(args=['shows', 'reconcile'])
+
+        self.assertEqual(result.exit_code, 0)
+        db.session.remove()
+        venue = Venue.query.get(venue_id)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 1))
+
+    def test_cached_page_served_without_queries(self):
+        self.add_venue('The Musical Hop')
+        first = self.client().get('/venues')
+
+        with count_queries() as statements:
+            second = self.client().get('/venues')
+
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(len(statements), 0)
+
+    def test_cached_page_invalidated_on_commit(self):
+        self.add_venue('The Musical Hop')
+        self.assertNotIn(b'Park Square', self.client().get('/venues').data)
+
+        self.add_venue('Park Square Live Music & Coffee')
+
+        self.assertIn(b'Park Square', self.client().get('/venues').data)
+
+    def test_lru_backend_evicts_least_recently_used(self):
+        backend = LRUBackend(max_entries=2)
+        for key in ('a', 'b'):
+            backend.set(key, key, ('Venue',), 60, backend.generation())
+        backend.get('a')
+        backend.set('c', 'c', ('Artist',), 60, backend.generation())
+
+        self.assertEqual(backend.get('a'), 'a')
+        self.assertIsNone(backend.get('b'))
+
+        backend.invalidate(('Venue',))
+        self.assertIsNone(backend.get('a'))
+        self.assertEqual(backend.get('c'), 'c')
+
+    def test_file_backend_invalidates_by_tag(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = FileBackend(directory)
+            generation = backend.generation()
+            backend.set('/venues', 'venues page', ('Venue', 'Show'), 60, generation)
+            backend.set('/artists', 'artists page', ('Artist',), 60, generation)
+
+            backend.invalidate(('Show',))
+
+            self.assertIsNone(backend.get('/venues'))
+            self.assertEqual(FileBackend(directory).get('/artists'), 'artists page')
+            # a page rendered before the invalidation is not stored
+            backend.set('/venues', 'stale page', ('Venue',), 60, generation)
+            self.assertIsNone(backend.get('/venues'))
+
+    def test_file_backend_drops_page_invalidated_while_stored(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backend = FileBackend(directory)
+            generation = backend.generation()
+            replace = os.replace
+
+            def invalidate_then_replace(source, destination):
+                # a commit in another worker, after the generation check
+                with mock.patch('os.replace', replace):
+                    FileBackend(directory).invalidate(('Venue',))
+                replace(source, destination)
+
+            with mock.patch('os.replace', invalidate_then_replace):
+                backend.set('/venues', 'stale page', ('Venue',), 60, generation)
+
+            self.assertIsNone(backend.get('/venues'))
+            self.assertEqual(backend.generation(), generation + 1)
+            backend.invalidate(('Venue',))
+            self.assertEqual(backend.generation(), generation + 2)
+
+    def test_import_shows_from_csv(self):
+        artist_id = self.add_artist('Guns N Petals')
+        venue_id = self.add_venue('The Musical Hop')
+        later = (datetime.now() + timedelta(days=1)).isoformat()
+        earlier = (datetime.now() - timedelta(days=1)).isoformat()
+        source = io.StringIO('\n'.join([
+            'artist_id,venue_id,start_time',
+            '{},{},{}'.format(artist_id, venue_id, later),
+            '{},{},{}'.format(artist_id, venue_id, earlier),
+            '{},{},{}'.format(artist_id, venue_id + 100, later),
+            'x,{},{}'.format(venue_id, later),
+            '{},{},not a date'.format(artist_id, venue_id),
+            '{},{},{}'.format(artist_id, venue_id, later),
+        ]))
+        errors = []
+
+        imported, rejected = import_shows(source, 'csv', batch_size=2,
+                                          report=lambda line, message: errors.append(line))
+
+        # the last row books the venue again at the same time
+        self.assertEqual((imported, rejected), (2, 4))
+        self.assertEqual(sorted(errors), [4, 5, 6, 7])
+        self.assertEqual(Show.query.count(), 2)
+        db.session.remove()
+        venue = Venue.query.get(venue_id)
+        self.assertEqual((venue.upcoming_shows_count, venue.past_shows_count), (1, 1))
+
+    def test_import_shows_command_jsonl(self):
+        artist_id = self.add_artist('Guns N Petals')
+        venue_id = self.add_venue('The Musical Hop')
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            f.write('{{"artist_id": {}, "venue_id": {}, "start_time": "2035-04-01T20:00:00"}}\n'.format(artist_id, venue_id))
+            f.write('not json\n')
+            # an offset is converted to local time rather than failing the batch
+            f.write('{{"artist_id": {}, "venue_id": {}, "start_time": "2035-04-02T20:00:00Z"}}\n'.format(artist_id, venue_id))
+
+        try:
+            result = app.test_cli_runner(mix_stderr=False).invoke(args=['shows', 'import', f.name])
+        finally:
+            os.remove(f.name)
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertIn('2 shows imported, 1 rejected', result.stdout)
+        self.assertIn(':2: unreadable record', result.stderr)
+        expected = datetime(2035, 4, 2, 20, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        self.assertIn(expected, [show.start_time for show in Show.query])
+
+    def test_format_datetime_accepts_strings_and_datetimes(self):
+        start_time = datetime(2035, 4, 1, 20, 30)
+
+        self.assertEqual(format_datetime(start_time, 'full'), 'Sunday April, 1, 2035 at 8:30PM')
+        self.assertEqual(format_datetime('2035-04-01 20:30:00', 'full'), 'Sunday April, 1, 2035 at 8:30PM')
+        self.assertEqual(format_datetime('April 1 2035 8:30pm'), 'Sun 04, 01, 2035 8:30PM')
+
+    def test_shows_page_formats_start_times(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime(2035, 4, 1, 20, 30))
+
+        res = self.client().get('/shows')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Sunday April, 1, 2035 at 8:30PM', res.data)
+
+    def test_artists_page_walks_forward_and_back(self):
+        for name in ('Delta', 'Alpha', 'Echo', 'Charlie', 'Bravo'):
+            self.add_artist(name)
+
+        first = artists_page(per_page=2)
+        second = artists_page(first['next_cursor'], per_page=2)
+        third = artists_page(second['next_cursor'], per_page=2)
+        back = artists_page(third['prev_cursor'], per_page=2)
+
+        self.assertEqual([artist['name'] for artist in first['data']], ['Alpha', 'Bravo'])
+        self.assertIsNone(first['prev_cursor'])
+        self.assertEqual([artist['name'] for artist in second['data']], ['Charlie', 'Delta'])
+        self.assertEqual([artist['name'] for artist in third['data']], ['Echo'])
+        self.assertIsNone(third['next_cursor'])
+        self.assertEqual(back['data'], second['data'])
+        self.assertIsNotNone(back['next_cursor'])
+
+    def test_shows_json_orders_by_start_time_and_id(self):
+        start_time = datetime(2035, 4, 1, 20, 30)
+        for i, hours in enumerate((2, 0, 0, 1)):
+            venue_id = self.add_venue('Hall {}'.format(i))
+            artist_id = self.add_artist('Band {}'.format(i))
+            self.add_show(venue_id, artist_id, start_time + timedelta(hours=hours))
+
+        first = self.client().get('/api/v1/shows/page').get_json()
+        page = shows_page(per_page=3)
+        rest = shows_page(page['next_cursor'], per_page=3)
+
+        self.assertEqual([show['start_time'] for show in first['data']], [
+            '2035-04-01 20:30:00', '2035-04-01 20:30:00', '2035-04-01 21:30:00', '2035-04-01 22:30:00'])
+        self.assertEqual(page['data'] + rest['data'], first['data'])
+        self.assertIsNone(rest['next_cursor'])
+
+    def test_artists_page_links_to_next_page(self):
+        for i in range(25):
+            self.add_artist('Artist {:02}'.format(i))
+
+        res = self.client().get('/artists')
+        cursor = artists_page()['next_cursor']
+        next_page = self.client().get('/artists?cursor=' + cursor)
+
+        self.assertIn(b'Artist 19', res.data)
+        self.assertNotIn(b'Artist 20', res.data)
+        self.assertIn(b'Next', res.data)
+        self.assertIn(b'Artist 24', next_page.data)
+        self.assertIn(b'Previous', next_page.data)
+
+    def test_400_listing_bad_cursor(self):
+        self.assertEqual(self.client().get('/shows?cursor=not-a-cursor').status_code, 400)
+        self.assertEqual(self.client().get('/api/v1/artists/page?cursor=not-a-cursor').status_code, 400)
+
+    def test_api_streams_venue_directory(self):
+        venue_id = self.add_venue('The Musical Hop')
+        self.add_venue('The Dueling Pianos Bar', city='New York', state='NY')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime.now() + timedelta(days=1))
+
+        res = self.client().get('/api/v1/venues')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.is_streamed)
+        self.assertEqual(res.get_json(), venue_directory())
+
+    def test_api_venue_and_artist_details(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime.now() - timedelta(days=1))
+
+        venue = self.client().get('/api/v1/venues/{}'.format(venue_id)).get_json()
+        artist = self.client().get('/api/v1/artists/{}'.format(artist_id)).get_json()
+
+        self.assertEqual(venue['name'], 'The Musical Hop')
+        self.assertEqual(venue['past_shows'][0]['artist_name'], 'Guns N Petals')
+        self.assertEqual(artist['past_shows_count'], 1)
+        self.assertEqual(self.client().get('/api/v1/artists').get_json(), [{'id': artist_id, 'name': 'Guns N Petals'}])
+
+    def test_404_api_unknown_venue(self):
+        res = self.client().get('/api/v1/venues/1000')
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(res.get_json()['message'], 'resource not found')
+
+    def test_api_not_modified_until_commit(self):
+        # with the default configuration
+        self.assertIsInstance(page_cache.backend, FileBackend)
+        self.add_artist('Guns N Petals')
+        etag = self.client().get('/api/v1/artists').headers['ETag']
+
+        with count_queries() as statements:
+            res = self.client().get('/api/v1/artists', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(len(statements), 0)
+
+        # committed by another worker sharing the cache directory
+        FileBackend(app.config['CACHE_DIR']).invalidate(('Artist',))
+        res = self.client().get('/api/v1/artists', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+
+    def test_api_sends_no_etag_from_per_process_cache(self):
+        backend = page_cache.backend
+        page_cache.backend = LRUBackend()
+        self.addCleanup(setattr, page_cache, 'backend', backend)
+        self.add_artist('Guns N Petals')
+
+        res = self.client().get('/api/v1/artists')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('ETag', res.headers)
+
+    def test_metrics_report_pool_usage(self):
+        self.add_venue('The Musical Hop')
+        self.client().get('/venues')
+
+        res = self.client().get('/metrics')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'fyyur_db_pool_in_use 0', res.data)
+        self.assertIn(b'fyyur_db_pool_checkout_wait_seconds_total', res.data)
+
+    def use_replica(self):
+        # A second database stands in for the replica; it only has what a
+        # test writes to it directly.
+        replica_path = os.environ.get(
+            'TEST_REPLICA_DATABASE_URL',
+            "postgresql://{}:{}@{}/{}".format('student', 'student', 'localhost:5432', 'fyyur_replica_test'))
+        app.config['SQLALCHEMY_BINDS'] = {'replica': replica_path}
+        replica = db.get_engine(bind='replica')
+        db.Model.metadata.create_all(replica)
+
+        def drop_replica():
+            db.session.remove()
+            db.Model.metadata.drop_all(replica)
+            replica.dispose()
+            app.config['SQLALCHEMY_BINDS'] = {}
+        self.addCleanup(drop_replica)
+        return replica
+
+    def test_get_requests_read_from_replica(self):
+        replica = self.use_replica()
+        self.add_venue('Primary Hall')
+        with replica.begin() as connection:
+            connection.execute(Venue.__table__.insert().values(
+                name='Replica Hall', city='San Francisco', state='CA', genres=['Jazz'], created_date=datetime.now()))
+
+        res = self.client().get('/api/v1/venues')
+
+        self.assertEqual([venue['name'] for venue in res.get_json()[0]['venues']], ['Replica Hall'])
+
+    def test_writes_go_to_primary_and_pin_the_client(self):
+        self.use_replica()
+        venue_id = self.add_venue('Primary Hall')
+        artist_id = self.add_artist('Guns N Petals')
+        client = self.client()
+
+        res = client.post('/shows/create', data={
+            'artist_id': artist_id,
+            'venue_id': venue_id,
+            'start_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('primary_until=', res.headers['Set-Cookie'])
+        self.assertEqual(Show.query.count(), 1)
+        # the client that wrote reads its own show back from the primary...
+        self.assertEqual(len(client.get('/api/v1/shows').get_json()), 1)
+        # ...while others read the (lagging) replica
+        self.assertEqual(self.client().get('/api/v1/shows').get_json(), [])
+
+    def test_pinned_client_bypasses_page_cache(self):
+        self.use_replica()
+        venue_id = self.add_venue('Primary Hall')
+        artist_id = self.add_artist('Guns N Petals')
+        client = self.client()
+        client.post('/shows/create', data={
+            'artist_id': artist_id,
+            'venue_id': venue_id,
+            'start_time': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        })
+
+        # another client renders /shows from the replica, which lacks the show
+        self.assertNotIn(b'Guns N Petals', self.client().get('/shows').data)
+
+        self.assertIsNone(page_cache.backend.get('/shows?'))
+        self.assertIn(b'Guns N Petals', client.get('/shows').data)
+
+    def use_write_behind(self):
+        # Submissions are journaled but only committed when the test runs a
+        # batch itself.
+        journal_dir = tempfile.TemporaryDirectory()
+        app.config.update(WRITE_BEHIND=True, WRITE_BEHIND_WORKERS=0,
+                          WRITE_BEHIND_JOURNAL=os.path.join(journal_dir.name, 'journal.sqlite3'))
+        write_behind.init_app(app)
+
+        def disable():
+            app.config['WRITE_BEHIND'] = False
+            write_behind.init_app(app)
+            journal_dir.cleanup()
+        self.addCleanup(disable)
+
+    def test_write_behind_commits_queued_submissions(self):
+        self.use_write_behind()
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        start_time = (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d %H:%M:%S')
+        client = self.client()
+
+        venue = client.post('/venues/create', data={
+            'name': 'Park Square Live Music & Coffee', 'city': 'San Francisco', 'state': 'CA',
+            'address': '34 Whiskey Moore Ave', 'genres': ['Jazz'],
+            'facebook_link': 'https://www.facebook.com/ParkSquareLiveMusicAndCoffee'
+        })
+        first = client.post('/shows/create', data={'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time})
+        second = client.post('/shows/create', data={'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time})
+
+        self.assertIn(b'will be listed shortly', venue.data)
+        self.assertEqual(Venue.query.count(), 1)
+        status_urls = [re.search(r'data-url="([^"]+)"', res.data.decode()).group(1) for res in (venue, first, second)]
+        self.assertEqual([client.get(url).get_json()['status'] for url in status_urls], ['pending'] * 3)
+
+        self.assertEqual(write_behind.run_batch(), 3)
+
+        db.session.remove()
+        self.assertEqual(Venue.query.count(), 2)
+        self.assertEqual(Show.query.count(), 1)
+        results = [client.get(url).get_json() for url in status_urls]
+        self.assertEqual([result['status'] for result in results], ['done', 'done', 'failed'])
+        self.assertIn('already booked', results[2]['message'])
+
+    def test_write_behind_rejects_invalid_form(self):
+        self.use_write_behind()
+
+        res = self.client().post('/venues/create', data={'name': 'The Musical Hop'})
+
+        self.assertIn(b'could not be listed', res.data)
+        self.assertEqual(write_behind.run_batch(), 0)
+        self.assertEqual(self.client().get('/api/v1/submissions/unknown').status_code, 404)
+
+    def test_write_behind_with_csrf(self):
+        self.use_write_behind()
+        app.config['WTF_CSRF_ENABLED'] = True
+        self.addCleanup(app.config.update, WTF_CSRF_ENABLED=False)
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        client = self.client()
+        for form in ('/venues/create', '/artists/create'):
+            self.assertIn(b'name="csrf_token"', client.get(form).data)
+        page = client.get('/shows/create').data.decode()
+        token = re.search(r'name="csrf_token" type="hidden" value="([^"]+)"', page).group(1)
+        show = {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 20:00'}
+
+        forged = self.client().post('/shows/create', data=show)
+        res = client.post('/shows/create', data=dict(show, csrf_token=token))
+
+        self.assertIn(b'could not be listed', forged.data)
+        self.assertIn(b'will be listed shortly', res.data)
+        self.assertEqual(write_behind.run_batch(), 1)
+        db.session.remove()
+        self.assertEqual(Show.query.one().start_time, datetime(2035, 4, 1, 20, 0))
+
+    def test_write_behind_gives_up_on_failing_submission(self):
+        self.use_write_behind()
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        poison = write_behind.enqueue('unknown', {})
+        show = write_behind.enqueue('show', {
+            'artist_id': artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 20:00', 'duration': 120})
+
+        for _ in range(app.config['WRITE_BEHIND_MAX_ATTEMPTS'] + 1):
+            write_behind.run_batch()
+
+        self.assertEqual(write_behind.status(poison)['status'], 'failed')
+        self.assertEqual(write_behind.status(show)['status'], 'done')
+        self.assertEqual(write_behind.run_batch(), 0)
+
+    def test_profiled_request_splits_sql_and_templates(self):
+        self.add_venue('The Musical Hop')
+
+        profiler.token = 'secret'
+        self.addCleanup(setattr, profiler, 'token', None)
+
+        profiled = self.client().get('/venues', headers={'X-Profile': 'secret'})
+        plain = self.client().get('/artists')
+        res = self.client().get('/_debug/slow?format=json', headers={'X-Profile': 'secret'})
+
+        self.assertNotIn('X-Profile-Id', plain.headers)
+        entry = [p for p in res.get_json() if p['id'] == int(profiled.headers['X-Profile-Id'])][0]
+        self.assertEqual((entry['method'], entry['path'], entry['status']), ('GET', '/venues', 200))
+        self.assertEqual(entry['sql_statements'], 1)
+        self.assertGreater(entry['sql_ms'], 0)
+        self.assertGreater(entry['template_ms'], 0)
+        self.assertAlmostEqual(entry['wall_ms'], entry['sql_ms'] + entry['template_ms'] + entry['python_ms'], delta=0.1)
+        self.assertEqual(self.client().get('/_debug/slow', headers={'X-Profile': 'secret'}).status_code, 200)
+        self.assertEqual(self.client().get(
+            '/_debug/profiles/{}.collapsed'.format(entry['id']), headers={'X-Profile': 'secret'}).status_code, 200)
+
+    def test_profile_exports_collapsed_and_speedscope_stacks(self):
+        profile = Profile(1, 'GET', '/shows')
+        profile.stacks.update({('app', 'shows', 'render'): 3, ('app', 'shows'): 1})
+
+        self.assertEqual(profile.collapsed(), 'app;shows 1\napp;shows;render 3\n')
+        exported = profile.speedscope(0.005)
+        self.assertEqual([frame['name'] for frame in exported['shared']['frames']], ['app', 'shows', 'render'])
+        self.assertEqual(exported['profiles'][0]['samples'], [[0, 1], [0, 1, 2]])
+        self.assertEqual(exported['profiles'][0]['weights'], [5.0, 15.0])
+
+    def test_stack_sampler_idles_without_profiles(self):
+        sampler = StackSampler()
+        sampler.interval = 0.001
+        profile = Profile(1, 'GET', '/venues')
+        sampler.add(threading.get_ident(), profile)
+        deadline = time.time() + 5
+        while not profile.samples and time.time() < deadline:
+            time.sleep(0.001)
+        sampler.remove(threading.get_ident())
+        time.sleep(0.05)
+
+        with mock.patch('profiling.time') as clock:
+            time.sleep(0.05)
+
+        self.assertGreater(profile.samples, 0)
+        # no longer waking up every interval
+        self.assertFalse(clock.sleep.called)
+
+    def test_debug_pages_need_token_outside_debug_mode(self):
+        debug = app.debug
+        app.debug = False
+        profiler.token = 'secret'
+        try:
+            self.assertEqual(self.client().get('/_debug/slow').status_code, 404)
+            self.assertEqual(self.client().get('/_debug/slow', headers={'X-Profile': 'guess'}).status_code, 404)
+            self.assertEqual(self.client().get('/_debug/slow', headers={'X-Profile': 'secret'}).status_code, 200)
+            # a token in the URL would be written to the request log
+            self.assertEqual(self.client().get('/_debug/slow?profile_token=secret').status_code, 404)
+        finally:
+            app.debug = debug
+            profiler.token = None
+
+    def test_requests_logged_as_json_lines(self):
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        app.config['LOG_FILE'] = os.path.join(log_dir.name, 'fyyur.log')
+        structured_logging.start(app)
+        self.add_venue('The Musical Hop')
+
+        res = self.client().get('/venues', headers={'X-Request-Id': 'abc123'})
+        with app.test_request_context(headers={'X-Request-Id': 'abc123'}):
+            app.preprocess_request()
+            app.logger.warning('venue %s looks odd', 1)
+        structured_logging.stop()
+
+        self.assertEqual(res.headers['X-Request-Id'], 'abc123')
+        with open(app.config['LOG_FILE']) as f:
+            lines = [json.loads(line) for line in f]
+        request_line = [line for line in lines if line.get('route') == '/venues'][0]
+        self.assertEqual(request_line['request_id'], 'abc123')
+        self.assertEqual((request_line['method'], request_line['status']), ('GET', 200))
+        self.assertEqual(request_line['sql_statements'], 1)
+        self.assertGreater(request_line['response_size'], 0)
+        self.assertIn('latency_ms', request_line)
+        warning = [line for line in lines if line['level'] == 'WARNING'][0]
+        self.assertEqual((warning['message'], warning['request_id']), ('venue 1 looks odd', 'abc123'))
+
+    def test_full_log_queue_drops_records(self):
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+        logger = app.logger.getChild('dropped')
+        logger.addHandler(handler)
+        logger.propagate = False
+        try:
+            for i in range(3):
+                logger.error('record %d', i)
+        finally:
+            logger.removeHandler(handler)
+
+        self.assertEqual(handler.queue.get_nowait().msg, 'record 0')
+        self.assertEqual(handler.dropped, 2)
+
+    def test_request_session_released_after_error(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+
+        # a venue deleted behind the form's back passes the id check and
+        # fails the insert outside the handler's try block
+        self.assertTrue(venue_names.exists(venue_id))
+        db.session.execute(Venue.__table__.delete().where(Venue.id == venue_id))
+        db.session.commit()
+        app.config['PROPAGATE_EXCEPTIONS'] = False
+        try:
+            res = self.client().post('/shows/create', data={
+                'artist_id': artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 20:30:00'})
+        finally:
+            app.config['PROPAGATE_EXCEPTIONS'] = None
+
+        self.assertEqual(res.status_code, 500)
+        self.assertEqual(db.engine.pool.checkedout(), 0)
+        self.assertEqual(Show.query.count(), 0)
+
+    def test_show_form_rejects_unknown_ids(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+
+        res = self.client().post('/shows/create', data={
+            'artist_id': artist_id + 1, 'venue_id': 'hop', 'start_time': '2035-04-01 20:30:00'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'No artist has this ID. No venue has this ID.', res.data)
+        self.assertEqual(Show.query.count(), 0)
+
+    def test_show_form_checks_known_ids_without_queries(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_names.load()
+        venue_names.load()
+        # committed after the lookups were loaded
+        artist_id = self.add_artist('Guns N Petals')
+
+        with app.test_request_context(method='POST', data={'artist_id': artist_id, 'venue_id': venue_id}):
+            form = ShowForm()
+            with count_queries() as statements:
+                self.assertTrue(form.validate_ids())
+        self.assertEqual(statements, [])
+
+    def test_name_lookup_loads_outside_its_lock(self):
+        artist_id = self.add_artist('Guns N Petals')
+        held = []
+        def check_lock(conn, cursor, statement, parameters, context, executemany):
+            held.append(artist_names.lock.locked())
+
+        event.listen(db.engine, 'before_cursor_execute', check_lock)
+        try:
+            self.assertTrue(artist_names.exists(artist_id))
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', check_lock)
+        self.assertEqual(held, [False])
+
+    def test_name_completions(self):
+        hop_id = self.add_venue('The Musical Hop')
+        venue_id = self.add_venue('Park Square Live Music & Coffee')
+        artist_id = self.add_artist('Guns N Petals')
+
+        self.assertEqual(self.client().get('/api/v1/artists/names?q=pet').get_json(),
+                         [{'id': artist_id, 'name': 'Guns N Petals'}])
+        self.assertEqual([match['name'] for match in self.client().get('/api/v1/venues/names?q=MUS').get_json()],
+                         ['Park Square Live Music & Coffee', 'The Musical Hop'])
+
+        venue = Venue.query.get(venue_id)
+        venue.name = 'Park Square Coffee'
+        db.session.commit()
+        self.assertEqual(venue_names.complete('mus'), [{'id': hop_id, 'name': 'The Musical Hop'}])
+        self.assertEqual(venue_names.complete('park square c'), [{'id': venue_id, 'name': 'Park Square Coffee'}])
+        self.assertEqual(self.client().get('/api/v1/venues/names?q=').get_json(), [])
+
+    def test_browse_venues_by_genre_and_area(self):
+        self.add_venue('The Musical Hop', genres=['Jazz', 'Reggae', 'Swing'])
+        self.add_venue('Park Square Live Music & Coffee', genres=['Jazz', 'Folk'])
+        self.add_venue('The Dueling Pianos Bar', city='New York', state='NY', genres=['Jazz', 'Classical'])
+        self.add_venue('Blue Note Cellar', genres=['Blues'])
+
+        results = browse(Venue, ['Jazz'], city='San Francisco', state='CA')
+
+        self.assertEqual(results['count'], 2)
+        self.assertEqual([venue['name'] for venue in results['data']],
+                         ['Park Square Live Music & Coffee', 'The Musical Hop'])
+        self.assertEqual(results['facets']['areas'], [{'city': 'San Francisco', 'state': 'CA', 'count': 2}])
+        self.assertEqual(results['facets']['genres'][0], {'genre': 'Jazz', 'count': 2})
+        self.assertIn({'genre': 'Folk', 'count': 1}, results['facets']['genres'])
+
+    def test_browse_matches_any_or_all_genres(self):
+        self.add_venue('The Musical Hop', genres=['Jazz', 'Reggae'])
+        self.add_venue('Blue Note Cellar', genres=['Blues'])
+
+        self.assertEqual(browse(Venue, ['Jazz', 'Blues'], match='any')['count'], 2)
+        self.assertEqual(browse(Venue, ['Jazz', 'Reggae'], match='all')['count'], 1)
+        areas = browse(Venue)['facets']['areas']
+        self.assertEqual(areas, [{'city': 'San Francisco', 'state': 'CA', 'count': 2}])
+
+    def test_browse_pages(self):
+        self.add_venue('The Musical Hop', genres=['Jazz', 'Reggae'])
+        self.add_artist('Guns N Petals')
+
+        res = self.client().get('/venues/browse?genre=Jazz&city=San+Francisco&state=CA')
+        api = self.client().get('/api/v1/artists/browse?genre=Jazz').get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'The Musical Hop', res.data)
+        self.assertIn(b'genre=Jazz&amp;genre=Reggae', res.data)
+        self.assertEqual(api['data'][0]['name'], 'Guns N Petals')
+        self.assertEqual(self.client().get('/api/v1/venues/browse?match=some').status_code, 400)
+
+    def test_overlapping_show_rejected(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+        other_artist_id = self.add_artist('Matt Quevedo')
+        self.add_show(venue_id, artist_id, datetime(2035, 4, 1, 20, 0))
+
+        res = self.client().post('/shows/create', data={
+            'artist_id': other_artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 21:00:00'})
+        self.client().post('/shows/create', data={
+            'artist_id': other_artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 22:00:00', 'duration': '90'})
+
+        self.assertIn(b'already booked', res.data)
+        self.assertEqual(Show.query.count(), 2)
+
+    def test_show_with_offset_start_time(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+
+        res = self.client().post('/shows/create', data={
+            'artist_id': artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 20:00:00+02:00'})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(b'Show was successfully listed!', res.data)
+        expected = datetime(2035, 4, 1, 18, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+        self.assertEqual(Show.query.one().start_time, expected)
+        self.assertEqual(Venue.query.get(venue_id).upcoming_shows_count, 1)
+
+    def test_show_duration_validated(self):
+        venue_id = self.add_venue('The Musical Hop')
+        artist_id = self.add_artist('Guns N Petals')
+
+        for duration in ('0', '-30', 'long'):
+            res = self.client().post('/shows/create', data={
+                'artist_id': artist_id, 'venue_id': venue_id, 'start_time': '2035-04-01 20:00:00', 'duration': duration})
+            self.assertEqual(res.status_code, 200)
+            self.assertIn(b'Show was not listed.', res.data)
+        self.assertEqual(Show.query.count(), 0)
+
+    def test_available_slots_skip_bookings(self):
+        venue_id = self.add_venue('The Musical Hop')
+        other_venue_id = self.add_venue('Park Square Live Music & Coffee')
+        artist_id = self.add_artist('Guns N Petals')
+        self.add_show(venue_id, artist_id, datetime(2035, 4, 1, 18, 0))
+        self.add_show(other_venue_id, artist_id, datetime(2035, 4, 1, 22, 0))
+
+        day = (datetime(2035, 4, 1, 12, 0), datetime(2035, 4, 2, 0, 0))
+        venue_slots = available_slots(*day, duration=120, venue_id=venue_id)
+        both = self.client().get('/api/v1/venues/{}/available_slots?from=2035-04-01T12:00&to=2035-04-02'
+                                 '&duration=120&artist_id={}'.format(venue_id, artist_id)).get_json()
+
+        self.assertEqual(venue_slots, [
+            {'start': '2035-04-01 12:00:00', 'end': '2035-04-01 18:00:00'},
+            {'start': '2035-04-01 20:00:00', 'end': '2035-04-02 00:00:00'}])
+        self.assertEqual(both['slots'], [
+            {'start': '2035-04-01 12:00:00', 'end': '2035-04-01 18:00:00'},
+            {'start': '2035-04-01 20:00:00', 'end': '2035-04-01 22:00:00'}])
+        self.assertEqual(self.client().get(
+            '/api/v1/venues/{}/available_slots?from=2035-04-01&to=2035-06-01'.format(venue_id)).status_code, 400)
+        aware = self.client().get('/api/v1/venues/{}/available_slots?from=2035-04-01T12:00%2B00:00&to=2035-04-02T00:00Z'
+                                  '&duration=120'.format(venue_id))
+        self.assertEqual(aware.status_code, 200)
+        self.assertEqual(aware.get_json()['from'], str(
+            datetime(2035, 4, 1, 12, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)))
+
+    def test_request_over_query_budget_logged(self):
+        self.add_venue('The Musical Hop', genres=['Jazz'])
+        app.config['SQL_QUERY_BUDGET'] = 1
+        try:
+            with self.assertLogs(app.logger, 'WARNING') as logs:
+                res = self.client().get('/api/v1/venues/browse?genre=Jazz')
+        finally:
+            app.config['SQL_QUERY_BUDGET'] = 10
+
+        self.assertEqual(res.headers['X-SQL-Statements'], '2')
+        self.assertIn('/api/v1/venues/browse ran 2 SQL statements, over its budget of 1', logs.output[0])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
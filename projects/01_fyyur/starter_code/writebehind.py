@@ -0,0 +1,262 @@
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from psycopg2.errorcodes import EXCLUSION_VIOLATION
+from sqlalchemy import func
+from sqlalchemy.exc import DataError, IntegrityError, InterfaceError, OperationalError
+
+from models import db, Venue, Artist, Show
+
+#----------------------------------------------------------------------------#
+# Write-behind queue.
+#
+# With WRITE_BEHIND on, the create forms don't commit while the user waits:
+# the validated fields are appended to a SQLite journal and a pool of worker
+# threads commits them in batches, one transaction per batch with a savepoint
+# per submission so a rejected one doesn't take the others down. The journal
+# survives restarts, and several processes can share it: a batch is claimed
+# in one SQLite transaction, and claims older than WRITE_BEHIND_LEASE seconds
+# (from a worker that died) are handed out again. A submission is applied at
+# least once; one whose worker died between the database commit and marking
+# it done is applied again. When a whole batch fails its submissions are
+# retried one at a time, and one that has failed WRITE_BEHIND_MAX_ATTEMPTS
+# times is marked failed instead of being retried forever.
+#----------------------------------------------------------------------------#
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+JOURNAL_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS submissions (
+  id INTEGER PRIMARY KEY,
+  token TEXT NOT NULL UNIQUE,
+  kind TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  status TEXT NOT NULL,
+  message TEXT,
+  created REAL NOT NULL,
+  claimed REAL,
+  attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_submissions_status_id ON submissions (status, id);
+'''
+
+
+def create_venue(fields):
+    db.session.add(Venue(created_date=func.now(), **fields))
+
+
+def create_artist(fields):
+    db.session.add(Artist(created_date=func.now(), **fields))
+
+
+def create_show(fields):
+    db.session.add(Show(**fields))
+
+
+# What a submission of each kind does, inside its savepoint.
+APPLIERS = {
+    'venue': create_venue,
+    'artist': create_artist,
+    'show': create_show
+}
+
+
+def failure_message(error):
+    if isinstance(error, IntegrityError) and error.orig.pgcode == EXCLUSION_VIOLATION:
+        return 'The venue or the artist is already booked at that time.'
+    return 'The submission could not be saved.'
+
+
+def batch_failure_counts(error):
+    # A batch failing because the database can't be reached says nothing
+    # about its submissions; anything else counts as an attempt.
+    return not isinstance(error, (OperationalError, InterfaceError))
+
+
+class Journal(object):
+    # The SQLite file holding queued submissions and their status.
+
+    def __init__(self, path):
+        self.path = path
+        with self.connect() as connection:
+            connection.executescript(JOURNAL_SCHEMA)
+            columns = [row['name'] for row in connection.execute('PRAGMA table_info(submissions)')]
+            if 'attempts' not in columns:
+                # a journal from before attempts were counted
+                connection.execute('ALTER TABLE submissions ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0')
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.row_factory = sqlite3.Row
+        return Closing(connection)
+
+    def append(self, kind, payload):
+        token = uuid.uuid4().hex
+        with self.connect() as connection:
+            connection.execute(
+                'INSERT INTO submissions (token, kind, payload, status, created) VALUES (?, ?, ?, ?, ?)',
+                (token, kind, json.dumps(payload), PENDING, time.time()))
+        return token
+
+    def claim(self, limit, lease, max_attempts):
+        # Marks up to `limit` of the oldest pending submissions as running
+        # and returns them. Submissions already tried in a batch that failed
+        # come back on their own, so a bad one can only fail itself.
+        now = time.time()
+        with self.connect() as connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'UPDATE submissions SET status = ?, attempts = attempts + 1 WHERE status = ? AND claimed < ?',
+                (PENDING, RUNNING, now - lease))
+            connection.execute(
+                'UPDATE submissions SET status = ?, message = ? WHERE status = ? AND attempts >= ?',
+                (FAILED, failure_message(None), PENDING, max_attempts))
+            rows = connection.execute(
+                'SELECT id, kind, payload, attempts FROM submissions WHERE status = ? ORDER BY id LIMIT ?',
+                (PENDING, limit)).fetchall()
+            if rows and rows[0]['attempts']:
+                rows = rows[:1]
+            else:
+                rows = list(itertools.takewhile(lambda row: not row['attempts'], rows))
+            connection.executemany(
+                'UPDATE submissions SET status = ?, claimed = ? WHERE id = ?',
+                [(RUNNING, now, row['id']) for row in rows])
+            connection.execute('COMMIT')
+        return [(row['id'], row['kind'], json.loads(row['payload'])) for row in rows]
+
+    def finish(self, results):
+        # results: [(id, status, message)]
+        with self.connect() as connection:
+            connection.executemany(
+                'UPDATE submissions SET status = ?, message = ? WHERE id = ?',
+                [(status, message, submission_id) for submission_id, status, message in results])
+
+    def release(self, submission_ids, attempted=True):
+        with self.connect() as connection:
+            connection.executemany(
+                'UPDATE submissions SET status = ?, claimed = NULL, attempts = attempts + ? WHERE id = ?',
+                [(PENDING, int(attempted), submission_id) for submission_id in submission_ids])
+
+    def status(self, token):
+        with self.connect() as connection:
+            row = connection.execute(
+                'SELECT status, message FROM submissions WHERE token = ?', (token,)).fetchone()
+        return dict(row) if row is not None else None
+
+
+class Closing(object):
+    # sqlite3 connections used as context managers end the transaction but
+    # stay open; this closes them.
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self.connection
+
+    def __exit__(self, *exc_info):
+        self.connection.close()
+
+
+class WriteBehindQueue(object):
+
+    def __init__(self, app=None):
+        self.app = None
+        self.enabled = False
+        self.journal = None
+        self.workers = []
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('WRITE_BEHIND', False)
+        self.worker_count = app.config.get('WRITE_BEHIND_WORKERS', 2)
+        self.batch_size = app.config.get('WRITE_BEHIND_BATCH_SIZE', 50)
+        self.lease = app.config.get('WRITE_BEHIND_LEASE', 60)
+        self.max_attempts = app.config.get('WRITE_BEHIND_MAX_ATTEMPTS', 5)
+        self.poll_interval = app.config.get('WRITE_BEHIND_POLL_INTERVAL', 1.0)
+        if self.enabled:
+            self.journal = Journal(app.config.get(
+                'WRITE_BEHIND_JOURNAL', os.path.join(app.root_path, 'write_behind.sqlite3')))
+
+    def enqueue(self, kind, fields):
+        # Returns the token to poll the submission's status with.
+        token = self.journal.append(kind, fields)
+        self.start()
+        self.wakeup.set()
+        return token
+
+    def status(self, token):
+        return self.journal.status(token)
+
+    def start(self):
+        # Workers start with the first submission, so CLI commands and
+        # processes that never take one don't run any.
+        with self._start_lock:
+            if self.workers:
+                return
+            self.stopping.clear()
+            for n in range(self.worker_count):
+                worker = threading.Thread(target=self.work, name='write-behind-{}'.format(n), daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        for worker in self.workers:
+            worker.join()
+        self.workers = []
+
+    def work(self):
+        while not self.stopping.is_set():
+            if not self.run_batch():
+                self.wakeup.wait(self.poll_interval)
+                self.wakeup.clear()
+
+    def run_batch(self):
+        # Commits one batch; returns how many submissions it took.
+        batch = self.journal.claim(self.batch_size, self.lease, self.max_attempts)
+        if not batch:
+            return 0
+        with self.app.app_context():
+            try:
+                results = self.apply(batch)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.journal.release([submission_id for submission_id, kind, fields in batch], batch_failure_counts(e))
+                self.app.logger.exception('Write-behind batch of %d failed', len(batch))
+                return 0
+        self.journal.finish(results)
+        return len(batch)
+
+    def apply(self, batch):
+        results = []
+        for submission_id, kind, fields in batch:
+            savepoint = db.session.begin_nested()
+            try:
+                APPLIERS[kind](fields)
+                db.session.flush()
+                savepoint.commit()
+                results.append((submission_id, DONE, None))
+            except (ValueError, DataError, IntegrityError) as e:
+                savepoint.rollback()
+                results.append((submission_id, FAILED, failure_message(e)))
+        return results
+
+
+write_behind = WriteBehindQueue()
@@ -0,0 +1,104 @@
+# Quiz question selection benchmark.
+#
+# Empties the questions table of the (dedicated) database, grows it through
+# each of --sizes and compares, at every size, the old `ORDER BY random()
+# LIMIT 1` with `NOT IN (previous_questions)` against drawing from the
+# in-memory ids in flaskr/quiz.py (their first load timed separately):
+#
+#   python -m benchmarks.quiz --sizes 1000,10000,100000,1000000,10000000 \
+#       --database-url postgresql://...
+
+import argparse
+import random
+import time
+
+from sqlalchemy import func, text
+
+from flaskr import create_app
+from flaskr.quiz import ALL_CATEGORIES, SeenIds, sampler
+from models import db, Question, Category
+
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+SEED_BATCH = 500000
+
+
+def seed(total):
+    if db.session.query(func.count(Category.id)).scalar() == 0:
+        for category_type in CATEGORIES:
+            db.session.execute(text('INSERT INTO categories (type) VALUES (:type)'), {'type': category_type})
+    existing = db.session.query(func.count(Question.id)).scalar()
+    for start in range(existing + 1, total + 1, SEED_BATCH):
+        stop = min(start + SEED_BATCH - 1, total)
+        db.session.execute(text('''
+INSERT INTO questions (question, answer, category, difficulty)
+SELECT 'Question ' || i || '?', 'Answer ' || i, 1 + i % {categories}, 1 + i % 5
+FROM generate_series(:start, :stop) AS i
+'''.format(categories=len(CATEGORIES))), {'start': start, 'stop': stop})
+        db.session.commit()
+        print('seeded {} questions'.format(stop))
+    db.session.execute(text('ANALYZE questions'))
+    db.session.commit()
+
+
+def legacy_draw(category, previous_questions):
+    # what quiz_questions() used to run
+    query = Question.query.filter(~Question.id.in_(previous_questions))
+    if category != ALL_CATEGORIES:
+        query = query.filter(Question.category == category)
+    return query.order_by(func.random()).first()
+
+
+def quizzes(count, size):
+    # (category, previous questions) for each draw, as if at a random step
+    # of a quiz of up to 50 questions
+    rng = random.Random(0)
+    return [(rng.randint(0, len(CATEGORIES)), rng.sample(range(1, size + 1), rng.randint(0, 50)))
+            for _ in range(count)]
+
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def measure(run, draws):
+    latencies = []
+    for category, previous_questions in draws:
+        started = time.perf_counter()
+        run(category, previous_questions)
+        latencies.append((time.perf_counter() - started) * 1000)
+        db.session.rollback()
+    return percentile(latencies, 0.50), percentile(latencies, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark trivia quiz question selection.')
+    parser.add_argument('--sizes', default='1000,10000,100000,1000000,10000000')
+    parser.add_argument('--draws', type=int, default=500)
+    # ORDER BY random() sorts the table on every draw, so it gets fewer
+    parser.add_argument('--legacy-draws', type=int, default=20)
+    parser.add_argument('--database-url', default='postgresql://postgres@localhost:5432/trivia_bench')
+    args = parser.parse_args()
+
+    app = create_app({'DATABASE_PATH': args.database_url})
+    with app.app_context():
+        db.session.execute(text('TRUNCATE questions RESTART IDENTITY'))
+        db.session.commit()
+        print('{:>10}  {:>20}  {:>9}  {:>20}'.format('questions', 'before p50 / p99 ms', 'load ms', 'after p50 / p99 ms'))
+        for size in [int(size) for size in args.sizes.split(',')]:
+            seed(size)
+            legacy = measure(legacy_draw, quizzes(args.legacy_draws, size))
+
+            sampler.clear()
+            started = time.perf_counter()
+            for category in range(len(CATEGORIES) + 1):
+                sampler.ids(category)
+            load = (time.perf_counter() - started) * 1000
+            after = measure(lambda category, previous_questions: sampler.draw(category, SeenIds(previous_questions)),
+                            quizzes(args.draws, size))
+
+            print('{:>10}  {:>9.2f} / {:>8.2f}  {:>9.0f}  {:>9.3f} / {:>8.3f}'.format(size, *legacy, load, *after))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,23 +6,31 @@ from sqlalchemy import func
 import random
 from werkzeug.exceptions import HTTPException
 
-from models import setup_db, Question, Category
+from models import setup_db, database_path, Question
+from .quiz import ALL_CATEGORIES, SeenIds, sampler, quiz_progress, save_quiz_progress
+from .state import client_states
+from .categories import CACHE_CONTROL, category_cache
+from .search import full_text_search, ranked_matches, format_match, question_index
 
 QUESTIONS_PER_PAGE = 10
-CURRENT_CATEGORY_ID = 1
+# The current category of clients that haven't picked one.
+DEFAULT_CATEGORY_ID = 1
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    app.config.from_mapping(STATE_PATH=os.environ.get('TRIVIA_STATE_PATH'))
+    app.config.from_mapping(test_config or {})
+    setup_db(app, app.config.get('DATABASE_PATH', database_path))
+    client_states.init_app(app)
     cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     @app.after_request
     def after_request(response):
         response.headers.add(
             'Access-Control-Allow-Headers',
-            'Content-Type,Authorization,true')
+            'Content-Type,Authorization,X-Client-Token,true')
         response.headers.add(
             'Access-Control-Allow-Methods',
             'GET,PUT,POST,DELETE,OPTIONS')
@@ -30,18 +38,21 @@ def create_app(test_config=None):
 
     @app.route('/categories', methods=['GET'])
     def get_categories():
-        # get all categories in required format
+        # get all categories in required format, from the category cache,
+        # or a 304 when the client's copy is current
         try:
-            categories = Category.query.all()
-            formatted_categories = {cat.id: cat.type for cat in categories}
+            categories, body, etag = category_cache.get()
 
             if len(categories) == 0:
                 abort(404)
 
-            return jsonify({
-                'success': True,
-                'categories': formatted_categories
-            })
+            if request.if_none_match.contains(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = CACHE_CONTROL
+            return response
 
         except Exception as e:
                 if isinstance(e, HTTPException):
@@ -49,42 +60,51 @@ def create_app(test_config=None):
                 else:
                     abort(422)
 
-    def paginate_questions(request, selection):
-        # paginate questions retrieved from databased
-        page = request.args.get('page', 1, type=int)
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
-
-        questions = [question.format() for question in selection]
-        current_questions = questions[start:end]
-
-        return current_questions
+    def paginate_questions(request, selection, keyset=True, format_row=Question.format):
+        # returns one page of the selection (a query ordered by question id,
+        # unless keyset is off), formatted, and how many questions the whole
+        # selection holds. Only the page's rows are read: ?page= skips to it
+        # with OFFSET, and ?after=<id> (the last id of the previous page)
+        # seeks past that id through the index instead, which stays fast for
+        # deep pages.
+        after = request.args.get('after', None, type=int) if keyset else None
+        if after is not None:
+            current_page = selection.filter(Question.id > after)
+        else:
+            page = max(request.args.get('page', 1, type=int), 1)
+            current_page = selection.offset((page - 1) * QUESTIONS_PER_PAGE)
+
+        current_questions = [
+            format_row(row) for row in current_page.limit(QUESTIONS_PER_PAGE)]
+        total_questions = selection.order_by(None).with_entities(
+            func.count(Question.id)).scalar()
+
+        return current_questions, total_questions
 
     @app.route('/questions', methods=['GET'])
     def get_questions():
         # returns questions in the current category
-        all_categories = Category.query.all()
-        formatted_cats = {cat.id: cat.type for cat in all_categories}
+        formatted_cats = category_cache.categories()
 
-        if CURRENT_CATEGORY_ID not in formatted_cats:
-            print(CURRENT_CATEGORY_ID)
+        current_category_id = client_states.get().get('category', DEFAULT_CATEGORY_ID)
+
+        if current_category_id not in formatted_cats:
             abort(404)
 
-        current_category = formatted_cats[CURRENT_CATEGORY_ID]
+        current_category = formatted_cats[current_category_id]
 
         try:
             selection = Question.query.filter(
-                Question.category == CURRENT_CATEGORY_ID).order_by(Question.id).all()
+                Question.category == current_category_id).order_by(Question.id)
+            questions, total_questions = paginate_questions(request, selection)
 
-            if len(selection) == 0:
+            if total_questions == 0:
                 abort(404)
 
-            questions = paginate_questions(request, selection)
-
             return jsonify({
                 'success': True,
                 'questions': questions,
-                'total_questions': len(selection),
+                'total_questions': total_questions,
                 'current_category': current_category,
                 'categories': formatted_cats
             })
@@ -97,33 +117,27 @@ def create_app(test_config=None):
 
     @app.route('/categories/<int:cat_id>/questions', methods=['GET'])
     def get_cat_questions(cat_id):
-        # sets specified category as current category and returns questions in it
-        global CURRENT_CATEGORY_ID
-
-        CURRENT_CATEGORY_ID = cat_id
-    
+        # sets specified category as the client's current category and returns questions in it
         try:
-            current_category_id = Category.query.filter(
-              Category.id == CURRENT_CATEGORY_ID).one_or_none()
-            
-            if current_category_id is None:
+            current_category = category_cache.categories().get(cat_id)
+
+            if current_category is None:
                 abort(404)
 
-            current_category = current_category_id.type
+            client_states.get()['category'] = cat_id
 
             selection = Question.query.filter(
-                Question.category == CURRENT_CATEGORY_ID).order_by(Question.id).all()
+                Question.category == cat_id).order_by(Question.id)
+            questions, total_questions = paginate_questions(request, selection)
 
-            if len(selection) == 0:
+            if total_questions == 0:
                 abort(404)
-            
-            questions = paginate_questions(request, selection)
 
             return jsonify({
                 'success': True,
                 'current_category': current_category,
                 'questions': questions,
-                'total_questions': len(selection)
+                'total_questions': total_questions
             })
 
         except Exception as e:
@@ -185,18 +199,27 @@ def create_app(test_config=None):
 
     @app.route('/questions/search', methods=['POST'])
     def search_questions():
-        # returns questions that match the search term
+        # returns the questions whose question or answer match the search
+        # term, best match first, optionally in one category or difficulty
         body = request.get_json()
         search_term = body.get('searchTerm', None)
+        category = body.get('category', None)
+        difficulty = body.get('difficulty', None)
 
         try:
-            selection = Question.query.filter(
-                Question.question.ilike(f'%{search_term}%')).all()
-            questions = paginate_questions(request, selection)
+            if full_text_search():
+                selection = ranked_matches(search_term, category, difficulty)
+                questions, total_questions = paginate_questions(
+                    request, selection, keyset=False, format_row=format_match)
+            else:
+                questions, total_questions = question_index.search(
+                    search_term, category, difficulty,
+                    max(request.args.get('page', 1, type=int), 1), QUESTIONS_PER_PAGE)
 
             return jsonify({
                 'success': True,
-                'questions': questions
+                'questions': questions,
+                'total_questions': total_questions
             })
         except Exception as e:
                 if isinstance(e, HTTPException):
@@ -206,29 +229,39 @@ def create_app(test_config=None):
 
     @app.route('/quizzes', methods=['POST'])
     def quiz_questions():
-        # returns a question that was not previously given in the specified category
+        # returns a question that was not previously given in the specified category.
+        # Without previous_questions, the quiz's seen questions are kept in the
+        # client's state under the quiz_id returned with the first question.
         body = request.get_json()
         previous_questions = body.get('previous_questions', None)
         quiz_category = body.get('quiz_category', None)
 
         try:
-            if quiz_category['id'] == 0:
-                quiz_question = Question.query.filter(
-                    ~Question.id.in_(previous_questions)).order_by(func.random()).first()
+            if previous_questions is not None:
+                quiz_id = None
+                seen = SeenIds(int(question_id) for question_id in previous_questions)
             else:
-                quiz_question = Question.query.filter(
-                    Question.category == int(quiz_category['id']),
-                    ~Question.id.in_(previous_questions)).order_by(func.random()).first()
+                quiz_id, seen = quiz_progress(client_states.get(), body.get('quiz_id', None))
+
+            category = int(quiz_category['id']) if quiz_category else ALL_CATEGORIES
+            quiz_question = sampler.draw(category, seen)
+
+            if quiz_question is not None:
+                seen.add(quiz_question.id)
+            if quiz_id is not None:
+                save_quiz_progress(client_states.get(), quiz_id, category, seen)
 
             if quiz_question is None:
                 return jsonify({
                     "success": True,
-                    "question": 0
+                    "question": 0,
+                    "quiz_id": quiz_id
                 })
 
             return jsonify({
                 "success": True,
-                "question": quiz_question.format()
+                "question": quiz_question.format(),
+                "quiz_id": quiz_id
             })
         except Exception as e:
                 if isinstance(e, HTTPException):
@@ -0,0 +1,72 @@
+import hashlib
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import event
+
+from models import db, Category
+
+# Categories almost never change, so their {id: type} map and the
+# /categories response body are built once and kept until a category is
+# written through this app (its commit moves the version on) or, for writes
+# made elsewhere, for at most MAX_AGE seconds. The response's ETag is a hash
+# of its body, so every process serving the same categories agrees on it.
+
+MAX_AGE = 300
+# What browsers and proxies may do with the /categories response.
+CACHE_CONTROL = 'public, max-age=60'
+
+
+class CategoryCache(object):
+
+    def __init__(self, max_age=MAX_AGE):
+        self.max_age = max_age
+        self.version = 0
+        # (version, loaded at, categories, body, etag)
+        self.entry = None
+        self.lock = threading.Lock()
+
+    def get(self):
+        # (categories, /categories body, its ETag)
+        entry = self.entry
+        if entry is None or entry[0] != self.version or time.time() - entry[1] >= self.max_age:
+            # a write committed while loading leaves the entry stale
+            version = self.version
+            categories = {category.id: category.type for category in Category.query.order_by(Category.id)}
+            body = jsonify({
+                'success': True,
+                'categories': categories
+            }).get_data()
+            entry = (version, time.time(), categories, body, hashlib.sha1(body).hexdigest())
+            with self.lock:
+                self.entry = entry
+        return entry[2], entry[3], entry[4]
+
+    def categories(self):
+        return self.get()[0]
+
+    def invalidate(self):
+        with self.lock:
+            self.version += 1
+
+
+category_cache = CategoryCache()
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_category_changes(db_session, flush_context):
+    for instance in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        if isinstance(instance, Category):
+            db_session.info['categories_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_categories(db_session):
+    if db_session.info.pop('categories_changed', False):
+        category_cache.invalidate()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_category_changes(db_session):
+    db_session.info.pop('categories_changed', None)
@@ -0,0 +1,240 @@
+import random
+import secrets
+import threading
+import time
+from array import array
+
+from flask import current_app
+from sqlalchemy import event, text
+
+from models import db, Question
+
+# Quiz questions are drawn without sorting the questions table: the ids of
+# each category are kept in memory (loaded on first use, updated by this
+# process's commits and reloaded every IDS_MAX_AGE seconds so other
+# processes' changes show up), one is picked at random, and picks the quiz
+# has already seen are drawn again. Only one thread loads a category at a
+# time, and a stale category is reloaded in the background while requests
+# keep drawing from the old ids. A quiz's seen ids are kept in its
+# client's state (see state.py), so clients send the quiz_id instead of every
+# previous question.
+
+ALL_CATEGORIES = 0
+IDS_MAX_AGE = 300
+# Random picks tried before listing the unseen ids instead, which only
+# happens once most of a category has been asked.
+DRAW_ATTEMPTS = 16
+# One chunk of a category's ids (all of them for ALL_CATEGORIES) as a single
+# comma-separated string, which reads far faster than a row per id
+# (Postgres; other databases read a row per id).
+ID_CHUNK = text('''
+SELECT string_agg(id::text, ',' ORDER BY id) FROM (
+  SELECT id FROM questions
+  WHERE id > :after AND (:category = 0 OR category = :category)
+  ORDER BY id LIMIT :limit
+) AS chunk
+''')
+ID_CHUNK_SIZE = 100000
+
+
+class SeenIds(object):
+    # question ids as a sparse bitmap: {id // 64: 64-bit word}
+
+    def __init__(self, question_ids=()):
+        self.words = {}
+        for question_id in question_ids:
+            self.add(question_id)
+
+    def add(self, question_id):
+        index, bit = divmod(question_id, 64)
+        self.words[index] = self.words.get(index, 0) | (1 << bit)
+
+    def __contains__(self, question_id):
+        index, bit = divmod(question_id, 64)
+        return bool(self.words.get(index, 0) >> bit & 1)
+
+    def __len__(self):
+        return sum(bin(word).count('1') for word in self.words.values())
+
+    def to_json(self):
+        return [[index, word] for index, word in sorted(self.words.items())]
+
+    @classmethod
+    def from_json(cls, words):
+        seen = cls()
+        seen.words = {index: word for index, word in words}
+        return seen
+
+
+class QuestionSampler(object):
+
+    def __init__(self, max_age=IDS_MAX_AGE):
+        self.max_age = max_age
+        # category id (ALL_CATEGORIES for every question) -> (loaded at, ids)
+        self.categories = {}
+        # categories being reloaded in the background, and a lock per
+        # category held while its ids are read
+        self.loading = set()
+        self.load_locks = {}
+        # moved on by every change, so a load that overlaps one isn't kept
+        # as fresh
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def ids(self, category):
+        entry = self.categories.get(category)
+        if entry is not None:
+            if time.time() - entry[0] >= self.max_age:
+                self.refresh(category)
+            return entry[1]
+        with self.load_lock(category):
+            # loaded by another thread while this one waited
+            entry = self.categories.get(category)
+            if entry is not None:
+                return entry[1]
+            return self.load(category)
+
+    def load_lock(self, category):
+        with self.lock:
+            return self.load_locks.setdefault(category, threading.Lock())
+
+    def refresh(self, category):
+        # reloads a stale category in a background thread, unless one
+        # already is
+        with self.lock:
+            if category in self.loading:
+                return
+            self.loading.add(category)
+        app = current_app._get_current_object()
+
+        def reload():
+            try:
+                with app.app_context(), self.load_lock(category):
+                    self.load(category)
+            except Exception:
+                app.logger.exception('Reloading the ids of category %s failed', category)
+            finally:
+                with self.lock:
+                    self.loading.discard(category)
+        threading.Thread(target=reload, name='quiz-ids-{}'.format(category), daemon=True).start()
+
+    def load(self, category):
+        with self.lock:
+            version = self.version
+        ids = array('i')
+        if db.engine.dialect.name == 'postgresql':
+            while True:
+                chunk = db.session.execute(ID_CHUNK, {
+                    'after': ids[-1] if ids else 0, 'category': category, 'limit': ID_CHUNK_SIZE}).scalar()
+                if chunk is None:
+                    break
+                ids.extend(map(int, chunk.split(',')))
+        else:
+            query = db.session.query(Question.id)
+            if category != ALL_CATEGORIES:
+                query = query.filter(Question.category == category)
+            ids.extend(question_id for question_id, in query)
+        with self.lock:
+            # a change committed while loading may be missing from ids
+            self.categories[category] = (time.time() if version == self.version else 0, ids)
+        return ids
+
+    def draw(self, category, seen):
+        # a random question of the category (ALL_CATEGORIES for any) whose
+        # id isn't in seen, or None when they have all been seen
+        ids = self.ids(category)
+        for _ in range(DRAW_ATTEMPTS):
+            with self.lock:
+                if not ids:
+                    return None
+                question_id = ids[random.randrange(len(ids))]
+            if question_id in seen:
+                continue
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+            self.remove(question_id)
+        with self.lock:
+            unseen = [question_id for question_id in ids if question_id not in seen]
+        while unseen:
+            question_id = unseen.pop(random.randrange(len(unseen)))
+            question = Question.query.get(question_id)
+            if question is not None:
+                return question
+            self.remove(question_id)
+        return None
+
+    def add(self, question_id, category):
+        with self.lock:
+            self.version += 1
+            for key in (category, ALL_CATEGORIES):
+                if key in self.categories:
+                    self.categories[key][1].append(question_id)
+
+    def remove(self, question_id, category=None):
+        # from every loaded category when the question's category is unknown
+        with self.lock:
+            self.version += 1
+            for key, (loaded, ids) in self.categories.items():
+                if category is None or key in (category, ALL_CATEGORIES):
+                    try:
+                        ids.remove(question_id)
+                    except ValueError:
+                        pass
+
+    def clear(self):
+        with self.lock:
+            self.version += 1
+            self.categories = {}
+
+
+def quiz_progress(state, quiz_id):
+    # (quiz_id, seen ids) of the quiz a client state holds, or of a new quiz
+    # when quiz_id isn't the one it holds
+    quiz = state.get('quiz')
+    if quiz_id and quiz and quiz['id'] == quiz_id:
+        return quiz_id, SeenIds.from_json(quiz['seen'])
+    return secrets.token_urlsafe(8), SeenIds()
+
+
+def save_quiz_progress(state, quiz_id, category, seen):
+    state['quiz'] = {
+        'id': quiz_id,
+        'category': category,
+        'asked': len(seen),
+        'seen': seen.to_json()
+    }
+
+
+def category_id(category):
+    return int(category) if category is not None else None
+
+
+sampler = QuestionSampler()
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_question_changes(db_session, flush_context):
+    changes = db_session.info.setdefault('quiz_question_changes', [])
+    for question in db_session.new:
+        if isinstance(question, Question):
+            changes.append((sampler.add, question.id, category_id(question.category)))
+    for question in db_session.dirty:
+        if isinstance(question, Question):
+            # its category may have changed
+            changes.append((sampler.remove, question.id, None))
+            changes.append((sampler.add, question.id, category_id(question.category)))
+    for question in db_session.deleted:
+        if isinstance(question, Question):
+            changes.append((sampler.remove, question.id, None))
+
+
+@event.listens_for(db.session, 'after_commit')
+def apply_question_changes(db_session):
+    for change, question_id, category in db_session.info.pop('quiz_question_changes', ()):
+        change(question_id, category)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_question_changes(db_session):
+    db_session.info.pop('quiz_question_changes', None)
@@ -0,0 +1,187 @@
+import bisect
+import difflib
+import html
+import math
+import re
+import threading
+
+from sqlalchemy import and_, event, func
+
+from models import db, Question, SEARCH_CONFIG, search_vector
+
+# Question search over the question and the answer. On Postgres it runs on
+# the questions_search index: every word of the search term matches words
+# starting with it (stemmed, so "cups" finds "cup"), question words rank above
+# answer words, and the matching words come back wrapped in <mark>. A term
+# made only of words too common to be indexed ("the") falls back to a
+# substring match. Other databases (the SQLite test database) use an
+# inverted index built in Python from the questions table, which also
+# accepts close misspellings. Highlights are HTML: the question and answer
+# text in them is escaped (as html.escape does) before <mark> is added.
+
+HIGHLIGHT_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, HighlightAll=TRUE'
+HTML_ESCAPES = (('&', '&amp;'), ('<', '&lt;'), ('>', '&gt;'), ('"', '&quot;'), ("'", '&#x27;'))
+
+
+def words(text):
+    return re.findall(r'\w+', (text or '').lower())
+
+
+def full_text_search():
+    return db.engine.dialect.name == 'postgresql'
+
+
+def filters(category, difficulty):
+    conditions = []
+    if category:
+        conditions.append(Question.category == int(category))
+    if difficulty:
+        conditions.append(Question.difficulty == int(difficulty))
+    return conditions
+
+
+def ranked_matches(search_term, category=None, difficulty=None):
+    # a query of (Question, highlighted question, highlighted answer), best
+    # match first
+    query_text = ' & '.join(word + ':*' for word in words(search_term))
+    ts_query = func.to_tsquery(SEARCH_CONFIG, query_text)
+    if query_text and db.session.query(func.numnode(ts_query)).scalar():
+        match = search_vector().op('@@')(ts_query)
+        order = (func.ts_rank(search_vector(), ts_query).desc(), Question.id)
+    else:
+        ts_query = func.plainto_tsquery(SEARCH_CONFIG, search_term or '')
+        match = (func.coalesce(Question.question, '') + ' ' + func.coalesce(Question.answer, '')).ilike(
+            f'%{search_term or ""}%')
+        order = (Question.id,)
+    return db.session.query(
+        Question,
+        func.ts_headline(SEARCH_CONFIG, escaped(Question.question), ts_query, HIGHLIGHT_OPTIONS),
+        func.ts_headline(SEARCH_CONFIG, escaped(Question.answer), ts_query, HIGHLIGHT_OPTIONS)
+    ).filter(and_(match, *filters(category, difficulty))).order_by(*order)
+
+
+def escaped(column):
+    # the column's text as HTML, escaped in SQL for ts_headline, which
+    # passes markup in the text through
+    for character, escape in HTML_ESCAPES:
+        column = func.replace(column, character, escape)
+    return column
+
+
+def format_match(row):
+    question, question_highlight, answer_highlight = row
+    formatted = question.format()
+    formatted['highlight'] = {
+        'question': question_highlight,
+        'answer': answer_highlight
+    }
+    return formatted
+
+
+class QuestionIndex(object):
+    # word -> {question id: weight} over every question, built on the first
+    # search and again after questions are written
+
+    QUESTION_WEIGHT = 2
+    ANSWER_WEIGHT = 1
+
+    def __init__(self):
+        self.postings = None
+        self.vocabulary = []
+        self.questions = {}
+        self.lock = threading.Lock()
+
+    def load(self):
+        with self.lock:
+            if self.postings is not None:
+                return self.postings, self.vocabulary, self.questions
+            postings = {}
+            questions = {}
+            for question in Question.query:
+                questions[question.id] = (question.category, question.difficulty)
+                for text, weight in ((question.question, self.QUESTION_WEIGHT), (question.answer, self.ANSWER_WEIGHT)):
+                    for word in words(text):
+                        weights = postings.setdefault(word, {})
+                        weights[question.id] = weights.get(question.id, 0) + weight
+            self.postings, self.vocabulary, self.questions = postings, sorted(postings), questions
+            return postings, self.vocabulary, questions
+
+    def clear(self):
+        with self.lock:
+            self.postings = None
+
+    def matching_words(self, word, vocabulary):
+        # indexed words starting with word, or close misspellings of it
+        start = bisect.bisect_left(vocabulary, word)
+        found = []
+        for candidate in vocabulary[start:]:
+            if not candidate.startswith(word):
+                break
+            found.append(candidate)
+        return found or difflib.get_close_matches(word, vocabulary, n=3, cutoff=0.8)
+
+    def search(self, search_term, category=None, difficulty=None, page=1, per_page=10):
+        # (one page of formatted matches, best first, and how many match)
+        postings, vocabulary, questions = self.load()
+        # an empty term matches every question
+        scores = None if words(search_term) else dict.fromkeys(questions, 0)
+        highlighted = set()
+        for word in words(search_term):
+            word_scores = {}
+            for match in self.matching_words(word, vocabulary):
+                highlighted.add(match)
+                rarity = math.log(1 + len(questions) / len(postings[match]))
+                for question_id, weight in postings[match].items():
+                    word_scores[question_id] = max(word_scores.get(question_id, 0), weight * rarity)
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {question_id: score + word_scores[question_id]
+                          for question_id, score in scores.items() if question_id in word_scores}
+        if not scores:
+            return [], 0
+
+        if category:
+            scores = {question_id: score for question_id, score in scores.items()
+                      if questions[question_id][0] == int(category)}
+        if difficulty:
+            scores = {question_id: score for question_id, score in scores.items()
+                      if questions[question_id][1] == int(difficulty)}
+        ranked = sorted(scores, key=lambda question_id: (-scores[question_id], question_id))
+        page_ids = ranked[(page - 1) * per_page:page * per_page]
+        rows = {question.id: question for question in Question.query.filter(Question.id.in_(page_ids))} if page_ids else {}
+        return [format_match((rows[question_id],
+                              highlight(rows[question_id].question, highlighted),
+                              highlight(rows[question_id].answer, highlighted)))
+                for question_id in page_ids if question_id in rows], len(ranked)
+
+
+def highlight(text, highlighted):
+    # text as HTML, with the highlighted words wrapped in <mark>
+    def escape(match):
+        part = html.escape(match.group())
+        if match.group().lower() in highlighted:
+            return '<mark>{}</mark>'.format(part)
+        return part
+    return re.sub(r'\w+|\W+', escape, text or '')
+
+
+question_index = QuestionIndex()
+
+
+@event.listens_for(db.session, 'after_flush')
+def collect_indexed_changes(db_session, flush_context):
+    for instance in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        if isinstance(instance, Question):
+            db_session.info['questions_changed'] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def clear_question_index(db_session):
+    if db_session.info.pop('questions_changed', False):
+        question_index.clear()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def forget_indexed_changes(db_session):
+    db_session.info.pop('questions_changed', None)
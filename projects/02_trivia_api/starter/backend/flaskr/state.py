@@ -0,0 +1,136 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app, g, request
+
+# Per-client state (the current category, the quiz being played) kept on the
+# server under a token the client holds in the trivia_client cookie or sends
+# as an X-Client-Token header; clients never see each other's state. States
+# live in the app's memory, the most recently used STATE_MAX_CLIENTS of them,
+# unless STATE_PATH names a SQLite file for every worker process to share.
+
+TOKEN_COOKIE = 'trivia_client'
+TOKEN_HEADER = 'X-Client-Token'
+# Seconds a client's state is kept after its last change.
+STATE_MAX_AGE = 7 * 24 * 3600
+
+STATE_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS client_state (
+  token TEXT PRIMARY KEY,
+  data TEXT NOT NULL,
+  updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_client_state_updated ON client_state (updated);
+'''
+
+
+class MemoryStore(object):
+    # states as JSON strings, least recently used dropped first
+
+    def __init__(self, max_clients=10000, max_age=STATE_MAX_AGE):
+        self.max_clients = max_clients
+        self.max_age = max_age
+        self.states = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        with self.lock:
+            entry = self.states.get(token)
+            if entry is None or entry[0] < time.time() - self.max_age:
+                return None
+            self.states.move_to_end(token)
+            return entry[1]
+
+    def set(self, token, data):
+        with self.lock:
+            self.states[token] = (time.time(), data)
+            self.states.move_to_end(token)
+            while len(self.states) > self.max_clients:
+                self.states.popitem(last=False)
+
+
+class SQLiteStore(object):
+    # states in a SQLite file shared by every process on the host
+
+    def __init__(self, path, max_age=STATE_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self.writes = 0
+        connection = self.connect()
+        try:
+            connection.executescript(STATE_SCHEMA)
+        finally:
+            connection.close()
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def get(self, token):
+        connection = self.connect()
+        try:
+            row = connection.execute(
+                'SELECT data FROM client_state WHERE token = ? AND updated >= ?',
+                (token, time.time() - self.max_age)).fetchone()
+        finally:
+            connection.close()
+        return row[0] if row is not None else None
+
+    def set(self, token, data):
+        connection = self.connect()
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO client_state (token, data, updated) VALUES (?, ?, ?)',
+                (token, data, time.time()))
+            self.writes += 1
+            if self.writes % 1000 == 0:
+                connection.execute(
+                    'DELETE FROM client_state WHERE updated < ?', (time.time() - self.max_age,))
+        finally:
+            connection.close()
+
+
+class ClientStates(object):
+
+    def init_app(self, app):
+        max_age = app.config.get('STATE_MAX_AGE', STATE_MAX_AGE)
+        if app.config.get('STATE_PATH'):
+            store = SQLiteStore(app.config['STATE_PATH'], max_age)
+        else:
+            store = MemoryStore(app.config.get('STATE_MAX_CLIENTS', 10000), max_age)
+        app.extensions['client_states'] = store
+        app.after_request(self.save)
+
+    def get(self):
+        # the requesting client's state, a dict saved after the response
+        if 'client_state' not in g:
+            store = current_app.extensions['client_states']
+            token = request.headers.get(TOKEN_HEADER) or request.cookies.get(TOKEN_COOKIE)
+            data = store.get(token) if token else None
+            if data is None:
+                token = secrets.token_urlsafe(16)
+            g.client_token = token
+            g.client_state_data = data
+            g.client_state = json.loads(data) if data is not None else {}
+        return g.client_state
+
+    def save(self, response):
+        # clients only get a token once there is something to keep
+        if 'client_state' not in g or (not g.client_state and g.client_state_data is None):
+            return response
+        data = json.dumps(g.client_state, sort_keys=True)
+        if data != g.client_state_data:
+            current_app.extensions['client_states'].set(g.client_token, data)
+        if request.cookies.get(TOKEN_COOKIE) != g.client_token:
+            response.set_cookie(TOKEN_COOKIE, g.client_token, httponly=True,
+                                max_age=current_app.config.get('STATE_MAX_AGE', STATE_MAX_AGE))
+        response.headers[TOKEN_HEADER] = g.client_token
+        return response
+
+
+client_states = ClientStates()
@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import sqlite3
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, DDL, create_engine, event, func
+from sqlalchemy.engine import Engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
@@ -29,9 +31,12 @@ class Question(db.Model):
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
+  # pages and counts of a category's questions, in id order
+  __table_args__ = (Index('questions_category_id', 'category', 'id'),)
+
   def __init__(self, question, answer, category, difficulty):
     self.question = question
     self.answer = answer
@@ -75,4 +80,29 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+Question search
+
+The text search configuration and the weighted document (question words
+above answer words) that flaskr/search.py queries and the questions_search
+index is built on, on Postgres.
+'''
+SEARCH_CONFIG = 'english'
+
+def search_vector():
+  return func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(Question.question, '')), 'A').op('||')(
+    func.setweight(func.to_tsvector(SEARCH_CONFIG, func.coalesce(Question.answer, '')), 'B'))
+
+event.listen(Question.__table__, 'after_create', DDL('''
+CREATE INDEX questions_search ON questions USING gin ((
+  setweight(to_tsvector('english', coalesce(question, '')), 'A') ||
+  setweight(to_tsvector('english', coalesce(answer, '')), 'B')))
+''').execute_if(dialect='postgresql'))
+
+@event.listens_for(Engine, 'connect')
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+  # SQLite only checks the category foreign key when asked to
+  if isinstance(dbapi_connection, sqlite3.Connection):
+    dbapi_connection.execute('PRAGMA foreign_keys=ON')
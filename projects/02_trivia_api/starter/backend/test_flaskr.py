@@ -1,24 +1,53 @@
 import os
+import re
+import tempfile
+import time
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, text
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from flaskr.categories import category_cache
+from flaskr.quiz import sampler
+from flaskr.search import question_index
+from models import setup_db, db, Question, Category
 
 QUESTIONS_PER_PAGE = 10
 CURRENT_CATEGORY_ID = 1
 
+
+def load_trivia_psql():
+    # the rows of trivia.psql, for a database it can't be restored into
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'trivia.psql')) as f:
+        dump = f.read()
+    db.drop_all()
+    db.create_all()
+    for table, columns, rows in re.findall(r'COPY public\.(\w+) \(([^)]*)\) FROM stdin;\n(.*?)\\\.\n', dump, re.S):
+        names = [name.strip() for name in columns.split(',')]
+        insert = text('INSERT INTO {} ({}) VALUES ({})'.format(
+            table, ', '.join(names), ', '.join(':' + name for name in names)))
+        for row in rows.splitlines():
+            db.session.execute(insert, dict(zip(names, row.split('\t'))))
+    db.session.commit()
+    # rows loaded behind the caches' backs
+    sampler.clear()
+    category_cache.invalidate()
+    question_index.clear()
+
+
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
     def setUp(self):
         """Define test variables and initialize app."""
-        self.app = create_app()
-        self.client = self.app.test_client
         self.database_name = "trivia_test"
-        self.database_path = "postgres://{}:{}@{}/{}".format('student', 'student','localhost:5432', self.database_name)
-        setup_db(self.app, self.database_path)
+        # e.g. TEST_DATABASE_URL=sqlite:////tmp/trivia_test.sqlite3 to run without Postgres
+        self.database_path = os.environ.get(
+            'TEST_DATABASE_URL',
+            "postgres://{}:{}@{}/{}".format('student', 'student','localhost:5432', self.database_name))
+        self.app = create_app({'DATABASE_PATH': self.database_path})
+        self.client = self.app.test_client
 
         # binds the app to the current context
         with self.app.app_context():
@@ -26,6 +55,8 @@ class TriviaTestCase(unittest.TestCase):
             self.db.init_app(self.app)
             # create all tables
             self.db.create_all()
+            if self.database_path.startswith('sqlite'):
+                load_trivia_psql()
 
     def tearDown(self):
         pass
@@ -62,6 +93,15 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['categories'])
         self.assertFalse(len(data['questions']))
 
+    def test_get_questions_by_category_after_id(self):
+        res = self.client().get('/categories/1/questions?after=20')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        # questions added by other tests come after the seeded 21 and 22
+        self.assertEqual([question['id'] for question in data['questions']][:2], [21, 22])
+        self.assertGreaterEqual(data['total_questions'], 3)
+
     def test_delete_question(self):
         res = self.client().delete('/questions/23')
         data = json.loads(res.data)
@@ -76,7 +116,44 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True) 
         self.assertTrue(data['categories'])
-    
+
+
+    def test_get_categories_cached(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        self.assertEqual(res.headers['Cache-Control'], 'public, max-age=60')
+
+        statements = []
+        def count(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', count)
+            try:
+                res = self.client().get('/categories', headers={'If-None-Match': etag})
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', count)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+        self.assertEqual(statements, [])
+
+    def test_category_write_changes_categories_etag(self):
+        etag = self.client().get('/categories').headers['ETag']
+        with self.app.app_context():
+            category = Category('Music')
+            db.session.add(category)
+            db.session.commit()
+            try:
+                res = self.client().get('/categories', headers={'If-None-Match': etag})
+            finally:
+                db.session.delete(category)
+                db.session.commit()
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertIn('Music', data['categories'].values())
+
     def test_404_get_questions_by_category(self):
         res = self.client().get('/categories/10000/questions')
         data = json.loads(res.data)
@@ -124,6 +201,53 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertFalse(len(data['questions']))
     
+    def test_search_answers_ranked_and_highlighted(self):
+        res = self.client().post('/questions/search',json={"searchTerm":"cup"})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([question['id'] for question in data['questions']], [10, 11])
+        self.assertEqual(data['total_questions'], 2)
+        self.assertIn('<mark>Cup</mark>', data['questions'][0]['highlight']['question'])
+
+        res = self.client().post('/questions/search',json={"searchTerm":"fleming"})
+        data = json.loads(res.data)
+        self.assertEqual(data['questions'][0]['highlight']['answer'], 'Alexander <mark>Fleming</mark>')
+
+    def test_search_highlight_escapes_text(self):
+        res = self.client().post('/questions', json={
+            "question": "<script>alert('cup')</script> & cup?", "answer": "<b>Cup</b>", "category": 6, "difficulty": 1})
+        self.assertEqual(res.status_code, 200)
+        with self.app.app_context():
+            question = Question.query.filter(Question.answer == '<b>Cup</b>').one()
+            self.addCleanup(self.delete_question_row, question.id)
+
+        res = self.client().post('/questions/search', json={"searchTerm": "cup", "difficulty": 1})
+        highlight = json.loads(res.data)['questions'][0]['highlight']
+
+        self.assertEqual(highlight['question'],
+                         '&lt;script&gt;alert(&#x27;<mark>cup</mark>&#x27;)&lt;/script&gt; &amp; <mark>cup</mark>?')
+        self.assertEqual(highlight['answer'], '&lt;b&gt;<mark>Cup</mark>&lt;/b&gt;')
+
+    def test_search_filters(self):
+        res = self.client().post('/questions/search',json={"searchTerm":"the","difficulty":3})
+        data = json.loads(res.data)
+        self.assertEqual(sorted(question['id'] for question in data['questions']), [6, 10, 14])
+
+        res = self.client().post('/questions/search',json={"searchTerm":"the","difficulty":3,"category":3})
+        data = json.loads(res.data)
+        self.assertEqual([question['id'] for question in data['questions']], [14])
+
+    def test_search_pages(self):
+        first = json.loads(self.client().post('/questions/search',json={"searchTerm":""}).data)
+        second = json.loads(self.client().post('/questions/search?page=2',json={"searchTerm":""}).data)
+
+        self.assertGreater(first['total_questions'], 10)
+        self.assertEqual(second['total_questions'], first['total_questions'])
+        self.assertEqual(len(first['questions']), 10)
+        self.assertEqual(len(second['questions']), first['total_questions'] - 10)
+        self.assertFalse({question['id'] for question in first['questions']} & {question['id'] for question in second['questions']})
+
     def test_quiz(self):
         res = self.client().post('/quizzes',json={"previous_questions":[],"quiz_category":{"id":"1"}})
         data = json.loads(res.data)
@@ -139,7 +263,88 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['question']))
-    
+
+    def test_quiz_excludes_previous_questions(self):
+        res = self.client().post('/quizzes',json={"previous_questions":[16,17,18],"quiz_category":{"id":2}})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], 19)
+        self.assertIsNone(data['quiz_id'])
+
+    def test_stale_quiz_ids_reloaded_in_background(self):
+        with self.app.app_context():
+            ids = sampler.ids(2)
+            # added behind the sampler's back, e.g. by another process
+            question_id = db.session.execute(text(
+                "INSERT INTO questions (question, answer, category, difficulty) "
+                "VALUES ('test question', 'test answer', 2, 1) RETURNING id")).scalar()
+            db.session.commit()
+            self.addCleanup(self.delete_question_row, question_id)
+            with sampler.lock:
+                sampler.categories[2] = (0, ids)
+
+            self.assertIs(sampler.ids(2), ids)
+            for _ in range(100):
+                if 2 not in sampler.loading:
+                    break
+                time.sleep(0.05)
+
+            self.assertIn(question_id, sampler.ids(2))
+            self.assertNotIn(question_id, ids)
+
+    def delete_question_row(self, question_id):
+        with self.app.app_context():
+            db.session.execute(text('DELETE FROM questions WHERE id = :id'), {'id': question_id})
+            db.session.commit()
+            sampler.clear()
+            question_index.clear()
+
+    def test_quiz_session(self):
+        client = self.client()
+        quiz_id = None
+        asked = []
+        for _ in range(5):
+            res = client.post('/quizzes',json={"quiz_id":quiz_id,"quiz_category":{"id":2}})
+            data = json.loads(res.data)
+            self.assertEqual(res.status_code, 200)
+            quiz_id = data['quiz_id']
+            if data['question']:
+                asked.append(data['question']['id'])
+
+        # the art questions once each, then 0 for no more questions
+        self.assertTrue(quiz_id)
+        self.assertEqual(sorted(asked), [16, 17, 18, 19])
+        self.assertEqual(data['question'], 0)
+
+    def test_current_category_per_client(self):
+        art_client = self.client()
+        art_client.get('/categories/2/questions')
+
+        res = self.client().get('/questions')
+        data = json.loads(res.data)
+        self.assertEqual(data['current_category'], 'Science')
+
+        res = art_client.get('/questions')
+        data = json.loads(res.data)
+        self.assertEqual(data['current_category'], 'Art')
+
+    def test_client_state_shared_by_workers(self):
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        workers = []
+        for _ in range(2):
+            workers.append(create_app({
+                'DATABASE_PATH': self.database_path,
+                'STATE_PATH': os.path.join(state_dir.name, 'state.sqlite3')}))
+
+        res = workers[0].test_client().get('/categories/3/questions')
+        token = res.headers['X-Client-Token']
+        res = workers[1].test_client().get('/questions', headers={'X-Client-Token': token})
+        data = json.loads(res.data)
+
+        self.assertEqual(data['current_category'], 'Geography')
+
 # Make the tests conveniently executable
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
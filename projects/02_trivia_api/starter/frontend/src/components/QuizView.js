@@ -10,6 +10,7 @@ class QuizView extends Component {
     super();
     this.state = {
         quizCategory: null,
+        quizId: null,
         previousQuestions: [], 
         showAnswer: false,
         categories: {},
@@ -52,8 +53,9 @@ class QuizView extends Component {
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
+      // the server remembers the questions already asked in this quiz
       data: JSON.stringify({
-        previous_questions: previousQuestions,
+        quiz_id: this.state.quizId,
         quiz_category: this.state.quizCategory
       }),
       xhrFields: {
@@ -62,6 +64,7 @@ class QuizView extends Component {
       crossDomain: true,
       success: (result) => {
         this.setState({
+          quizId: result.quiz_id,
           showAnswer: false,
           previousQuestions: previousQuestions,
           currentQuestion: result.question,
@@ -90,6 +93,7 @@ class QuizView extends Component {
   restartGame = () => {
     this.setState({
       quizCategory: null,
+      quizId: null,
       previousQuestions: [], 
       showAnswer: false,
       numCorrect: 0,